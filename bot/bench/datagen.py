@@ -0,0 +1,101 @@
+"""Генератор синтетических данных в формате videos.json.
+
+Файл пишется потоково, поэтому масштаб ограничен только диском:
+    python -m bench.datagen bench_videos.json --videos 500 --hours 72
+    python -m bench.datagen big.json --videos 200000 --hours 100 --seed 7
+"""
+import argparse
+import json
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+COUNTERS = ('views_count', 'likes_count', 'comments_count', 'reports_count')
+
+# средний прирост за час и доля от просмотров для остальных счётчиков
+VIEWS_PER_HOUR = 40
+RATIOS = {'likes_count': 0.03, 'comments_count': 0.004, 'reports_count': 0.0005}
+
+
+def _ts(value: datetime) -> str:
+    return value.isoformat()
+
+
+def _video(rng: random.Random, creators: list[str], start: datetime, hours: int) -> dict:
+    video_id = str(uuid.UUID(int=rng.getrandbits(128)))
+    published = start - timedelta(days=rng.randint(0, 120), seconds=rng.randint(0, 86400))
+    popularity = rng.lognormvariate(0, 1.2)
+
+    counters = dict.fromkeys(COUNTERS, 0)
+    snapshots = []
+    for hour in range(hours):
+        created = start + timedelta(hours=hour, seconds=rng.random())
+        delta = {'views_count': int(rng.expovariate(1 / (VIEWS_PER_HOUR * popularity)))}
+        for name, ratio in RATIOS.items():
+            delta[name] = int(delta['views_count'] * ratio + rng.random())
+        for name in COUNTERS:
+            counters[name] += delta[name]
+        snapshots.append({
+            'id': uuid.UUID(int=rng.getrandbits(128)).hex,
+            'video_id': video_id,
+            **counters,
+            **{f'delta_{name}': value for name, value in delta.items()},
+            'created_at': _ts(created),
+            'updated_at': _ts(created),
+        })
+
+    first = snapshots[0]['created_at'] if snapshots else _ts(start)
+    last = snapshots[-1]['created_at'] if snapshots else _ts(start)
+    return {
+        'id': video_id,
+        'video_created_at': _ts(published),
+        **counters,
+        'creator_id': rng.choice(creators),
+        'created_at': first,
+        'updated_at': last,
+        'snapshots': snapshots,
+    }
+
+
+def generate(
+    path: str | Path,
+    videos: int,
+    hours: int,
+    creators: int | None = None,
+    start: datetime | None = None,
+    seed: int = 42,
+) -> int:
+    """Пишет videos.json и возвращает число снапшотов."""
+    rng = random.Random(seed)
+    start = start or datetime(2025, 11, 26, 11, tzinfo=timezone.utc)
+    creator_ids = [uuid.UUID(int=rng.getrandbits(128)).hex for _ in range(creators or max(1, videos // 10))]
+
+    total = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"videos": [\n')
+        for i in range(videos):
+            video = _video(rng, creator_ids, start, hours)
+            total += len(video['snapshots'])
+            if i:
+                f.write(',\n')
+            json.dump(video, f, ensure_ascii=False)
+        f.write('\n]}\n')
+    return total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Синтетический videos.json для бенчмарков')
+    parser.add_argument('path', type=Path)
+    parser.add_argument('--videos', type=int, default=500)
+    parser.add_argument('--hours', type=int, default=72, help='снапшотов на видео (по одному в час)')
+    parser.add_argument('--creators', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    total = generate(args.path, args.videos, args.hours, creators=args.creators, seed=args.seed)
+    print(f'{args.path}: видео {args.videos}, снапшотов {total}')
+
+
+if __name__ == '__main__':
+    main()
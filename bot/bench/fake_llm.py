@@ -0,0 +1,135 @@
+"""Детерминированная заглушка OpenRouter-клиента для бенчмарков и офлайн-проверок.
+
+Повторяет ту часть интерфейса AsyncOpenAI, которой пользуется
+pipeline.llm: client.chat.completions.create(model=..., messages=...),
+в том числе со stream=True. SQL выбирается по ключевым словам вопроса,
+задержка задаётся явно. В потоке первый кусок приходит через
+first_token_share задержки, остальное время делится между кусками, а после
+JSON идёт пояснение tail — его досрочная остановка потока не ждёт.
+model_latency и model_sql переопределяют задержку и SQL для отдельных
+моделей (например, чтобы одна отвечала медленно или с ошибкой); на просьбу
+исправить запрос модель всегда отвечает SQL по правилам.
+"""
+import asyncio
+import json
+import random
+import re
+from types import SimpleNamespace
+
+DEFAULT_RULES: list[tuple[str, str]] = [
+    (r"топ|самых", "SELECT id, views_count FROM videos ORDER BY views_count DESC LIMIT 10"),
+    (r"креатор|автор", "SELECT creator_id, COUNT(*) AS cnt FROM videos GROUP BY creator_id ORDER BY cnt DESC LIMIT 10"),
+    (r"вырос|прирост", "SELECT COALESCE(SUM(delta_views_count), 0) AS delta FROM video_daily_stats"),
+    (r"лайк", "SELECT SUM(likes_count) AS likes FROM videos"),
+    (r"снапшот|замер", "SELECT COUNT(*) AS cnt FROM video_snapshots"),
+]
+DEFAULT_SQL = "SELECT COUNT(*) AS cnt FROM videos"
+DEFAULT_TAIL = "\n\nЗапрос считает строки по условию вопроса и возвращает одно число."
+CHUNK_CHARS = 4
+
+
+class FakeStream:
+    def __init__(self, model: str, content: str, first_delay: float, chunk_delay: float, usage) -> None:
+        self.model = model
+        self.content = content
+        self.first_delay = first_delay
+        self.chunk_delay = chunk_delay
+        self.usage = usage
+        self.closed = False
+        self.sent = 0
+
+    async def __aiter__(self):
+        await asyncio.sleep(self.first_delay)
+        for start in range(0, len(self.content), CHUNK_CHARS):
+            if self.closed:
+                return
+            if start:
+                await asyncio.sleep(self.chunk_delay)
+            text = self.content[start:start + CHUNK_CHARS]
+            self.sent += len(text)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+        yield SimpleNamespace(choices=[], usage=self.usage)
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class FakeCompletions:
+    def __init__(
+        self, latency: float, jitter: float, rules, default_sql: str, seed: int,
+        tail: str = DEFAULT_TAIL, first_token_share: float = 0.3,
+        model_latency: dict[str, float] | None = None, model_sql: dict[str, str] | None = None,
+    ) -> None:
+        self.latency = latency
+        self.model_latency = model_latency or {}
+        self.model_sql = model_sql or {}
+        self.tail = tail
+        self.first_token_share = first_token_share
+        self.streams: list[FakeStream] = []
+        self.jitter = jitter
+        self.rules = [(re.compile(p, re.IGNORECASE), sql) for p, sql in rules]
+        self.default_sql = default_sql
+        self.calls = 0
+        self.requests: list[list[dict]] = []
+        self._rng = random.Random(seed)
+
+    def pick_sql(self, messages: list[dict]) -> str:
+        question = next(m["content"] for m in messages if m["role"] == "user")
+        question = question.rsplit("Вопрос пользователя:", 1)[-1]
+        for pattern, sql in self.rules:
+            if pattern.search(question):
+                return sql
+        return self.default_sql
+
+    async def create(self, model: str, messages: list[dict], stream: bool = False, **kwargs):
+        self.calls += 1
+        self.requests.append(messages)
+        delay = max(0.0, self._rng.gauss(self.model_latency.get(model, self.latency), self.jitter))
+        repair = messages[-1]["role"] == "user" and any(m["role"] == "assistant" for m in messages)
+        sql = self.model_sql.get(model) if not repair else None
+        content = json.dumps({"sql": sql or self.pick_sql(messages)}, ensure_ascii=False)
+        prompt_chars = sum(len(m["content"]) for m in messages)
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_chars // 4,
+            completion_tokens=len(content) // 4,
+            total_tokens=(prompt_chars + len(content)) // 4,
+        )
+        if stream:
+            content += self.tail
+            chunks = max(1, -(-len(content) // CHUNK_CHARS) - 1)
+            fake = FakeStream(
+                model, content, delay * self.first_token_share,
+                delay * (1 - self.first_token_share) / chunks, usage,
+            )
+            self.streams.append(fake)
+            return fake
+
+        await asyncio.sleep(delay)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+            usage=usage,
+        )
+
+
+class FakeLLMClient:
+    def __init__(
+        self,
+        latency: float = 1.0,
+        jitter: float = 0.0,
+        rules=None,
+        default_sql: str = DEFAULT_SQL,
+        seed: int = 42,
+        model_latency: dict[str, float] | None = None,
+        model_sql: dict[str, str] | None = None,
+    ) -> None:
+        self.chat = SimpleNamespace(
+            completions=FakeCompletions(
+                latency, jitter, rules or DEFAULT_RULES, default_sql, seed,
+                model_latency=model_latency, model_sql=model_sql,
+            )
+        )
+
+    @property
+    def calls(self) -> int:
+        return self.chat.completions.calls
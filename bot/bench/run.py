@@ -0,0 +1,224 @@
+"""Нагрузочный прогон /db против локального Postgres с заглушкой LLM.
+
+Подготовка данных (из каталога bot):
+    python -m bench.datagen /tmp/bench.json --videos 500 --hours 72
+    python -m dao.migrate
+    python -m dao.loader /tmp/bench.json
+
+Прогон:
+    python -m bench.run --users 20 --questions 500 --llm-latency 1.5
+    python -m bench.run --mode handler --compare bench/results/<прошлый>.json
+
+Результаты сохраняются в bench/results/<время>_<коммит>.json.
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+from bench.fake_llm import FakeLLMClient
+from gpt import ask_with_db, close_pipeline, init_pipeline
+from pipeline import llm
+from pipeline.metrics import trace
+from pipeline.sql_cache import sql_cache
+from user.schemas import DBQuestion
+from user.user_router import db_question
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+PERCENTILES = (0.5, 0.95, 0.99)
+
+_MONTHS = ['января', 'февраля', 'марта', 'апреля', 'мая', 'июня', 'июля',
+           'августа', 'сентября', 'октября', 'ноября', 'декабря']
+
+TEMPLATE_QUESTIONS = [
+    lambda rng, day: f"Сколько видео набрало больше {rng.choice([100, 1000, 10000, 100000])} просмотров?",
+    lambda rng, day: f"На сколько выросли просмотры {day.day} {_MONTHS[day.month - 1]} {day.year}?",
+    lambda rng, day: f"Покажи топ-{rng.choice([3, 5, 10])} видео по лайкам",
+]
+
+LLM_QUESTIONS = [
+    "Сколько всего видео в базе?",
+    "Какие креаторы самые активные?",
+    "Сколько лайков у всех видео вместе?",
+    "Сколько всего снапшотов собрано?",
+    "Покажи самых популярных авторов",
+]
+
+
+class FakeMessage:
+    def __init__(self, text: str, user_id: int) -> None:
+        self.text = text
+        self.from_user = SimpleNamespace(id=user_id)
+
+    async def answer(self, text: str, **kwargs) -> 'FakeMessage':
+        return self
+
+    async def edit_text(self, text: str, **kwargs) -> 'FakeMessage':
+        return self
+
+    async def answer_document(self, document, **kwargs) -> 'FakeMessage':
+        return self
+
+
+def make_questions(count: int, template_ratio: float, unique_ratio: float, days: list[date], seed: int) -> list[str]:
+    rng = random.Random(seed)
+    questions = []
+    for i in range(count):
+        if rng.random() < template_ratio:
+            questions.append(rng.choice(TEMPLATE_QUESTIONS)(rng, rng.choice(days)))
+        else:
+            question = rng.choice(LLM_QUESTIONS)
+            if rng.random() < unique_ratio:
+                question = f"{question} Вариант {i}"
+            questions.append(question)
+    return questions
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(samples: list[float]) -> dict:
+    return {
+        'count': len(samples),
+        **{f'p{int(q * 100)}': round(percentile(samples, q), 6) for q in PERCENTILES},
+        'mean': round(sum(samples) / len(samples), 6) if samples else 0.0,
+    }
+
+
+async def _ask(question: str, user_id: int, mode: str) -> tuple[dict, str]:
+    if mode == 'handler':
+        async with trace(user_id=user_id) as current:
+            await db_question(FakeMessage(f'/db {question}', user_id))
+        # хендлер сам ловит исключения и показывает ошибку пользователю
+        if current.outcome == 'error':
+            raise RuntimeError(f'Хендлер ответил ошибкой на вопрос: {question}')
+        return current.stages, current.path
+
+    parsed = DBQuestion(question=question)
+    async with trace(user_id=user_id) as current:
+        await ask_with_db(parsed.normalized_question, user_id=user_id, date_range=parsed.date_range)
+    return current.stages, current.path
+
+
+async def run(args: argparse.Namespace) -> dict:
+    fake = FakeLLMClient(latency=args.llm_latency, jitter=args.llm_jitter, seed=args.seed)
+    llm.set_client(fake)
+
+    days = [args.start_date + timedelta(days=i) for i in range(args.days)]
+    questions = make_questions(args.questions, args.template_ratio, args.unique_ratio, days, args.seed)
+    queue: asyncio.Queue[str] = asyncio.Queue()
+    for q in questions:
+        queue.put_nowait(q)
+
+    totals: list[float] = []
+    stages: dict[str, list[float]] = {}
+    paths: dict[str, int] = {}
+    errors = 0
+
+    async def user(user_id: int) -> None:
+        nonlocal errors
+        while not queue.empty():
+            question = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                timings, path = await _ask(question, user_id, args.mode)
+            except Exception:
+                errors += 1
+                continue
+            totals.append(time.perf_counter() - started)
+            paths[path] = paths.get(path, 0) + 1
+            for name, seconds in timings.items():
+                stages.setdefault(name, []).append(seconds)
+
+    await init_pipeline()
+    try:
+        if args.purge_cache:
+            await sql_cache.purge()
+        started = time.perf_counter()
+        await asyncio.gather(*(user(i) for i in range(args.users)))
+        wall = time.perf_counter() - started
+    finally:
+        await close_pipeline()
+
+    return {
+        'config': {k: str(v) if isinstance(v, (date, Path)) else v for k, v in vars(args).items()},
+        'commit': _git_commit(),
+        'finished_at': datetime.now().isoformat(timespec='seconds'),
+        'wall_seconds': round(wall, 3),
+        'qps': round(len(totals) / wall, 2) if wall else 0.0,
+        'errors': errors,
+        'llm_calls': fake.calls,
+        'paths': paths,
+        'total': summarize(totals),
+        'stages': {name: {**summarize(v), 'qps': round(len(v) / wall, 2)} for name, v in sorted(stages.items())},
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_report(report: dict, baseline: dict | None = None) -> None:
+    print(f"commit {report['commit']}: {report['qps']} вопросов/с, ошибок {report['errors']}, "
+          f"вызовов LLM {report['llm_calls']}, пути {report['paths']}")
+    rows = [('total', report['total'])] + list(report['stages'].items())
+    base_rows = {}
+    if baseline:
+        base_rows = {'total': baseline['total'], **baseline['stages']}
+        print(f"сравнение с {baseline['commit']} ({baseline['qps']} вопросов/с)")
+
+    print(f"{'стадия':<14}{'n':>7}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, s in rows:
+        line = f"{name:<14}{s['count']:>7}{s['p50']:>10.4f}{s['p95']:>10.4f}{s['p99']:>10.4f}"
+        base = base_rows.get(name)
+        if base and base['p95']:
+            line += f"   p95 {100 * (s['p95'] - base['p95']) / base['p95']:+.1f}%"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Бенчмарк /db с заглушкой LLM')
+    parser.add_argument('--mode', choices=('ask', 'handler'), default='ask',
+                        help='вызывать ask_with_db напрямую или через хендлер db_question')
+    parser.add_argument('--users', type=int, default=10, help='одновременных пользователей')
+    parser.add_argument('--questions', type=int, default=200)
+    parser.add_argument('--template-ratio', type=float, default=0.5)
+    parser.add_argument('--unique-ratio', type=float, default=0.5,
+                        help='доля LLM-вопросов, которые не попадут в кэш SQL')
+    parser.add_argument('--llm-latency', type=float, default=1.0)
+    parser.add_argument('--llm-jitter', type=float, default=0.2)
+    parser.add_argument('--start-date', type=date.fromisoformat, default=date(2025, 11, 26))
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--purge-cache', action='store_true', help='очистить кэш SQL перед прогоном')
+    parser.add_argument('--compare', type=Path, help='файл прошлого прогона для сравнения')
+    parser.add_argument('--output', type=Path, help='куда сохранить результат')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+
+    output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d_%H%M%S}_{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    baseline = json.loads(args.compare.read_text(encoding='utf-8')) if args.compare else None
+    print_report(report, baseline)
+    print(f'Результат сохранён в {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,78 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str
     POSTGRES_HOST: str
     POSTGRES_PORT: int    
+    DB_REPLICA_URL: str | None = None
+    PG_POOL_MIN_SIZE: int = 1
+    PG_POOL_MAX_SIZE: int = 10
+    PG_POOL_ACQUIRE_TIMEOUT: float = 5.0
+    PG_STATEMENT_TIMEOUT_MS: int = 15000
+    PG_TIMEZONE: str = "UTC"
+    PG_STATEMENT_CACHE_SIZE: int = 256
+    SCHEMA_CHECK_INTERVAL: float = 60.0
+    SCHEMA_CACHE_TTL: float = 3600.0
+    PROMPT_PRUNE_SCHEMA: bool = True
+    SNAPSHOT_PARTITION_INTERVAL: str = "month"
+    SNAPSHOT_PARTITIONS_AHEAD: int = 2
+    SNAPSHOT_RETENTION: int = 0
+    SNAPSHOT_RETENTION_MODE: str = "detach"
+    PARTITION_MAINTENANCE_INTERVAL: float = 6 * 3600
+    GPT_CREDENTIALS: str | None = None
+    LLM_BASE_URL: str = "https://openrouter.ai/api/v1"
+    LLM_MODEL: str = "deepseek/deepseek-v3.2"
+    LLM_TIMEOUT: float = 60.0
+    LLM_MAX_RETRIES: int = 3
+    LLM_RETRY_BASE_DELAY: float = 0.5
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_USER_QUEUE_SIZE: int = 3
+    LLM_STREAM: bool = True
+    LLM_HEDGE_MODELS: list[str] = []
+    LLM_HEDGE_PERCENTILE: float = 0.9
+    LLM_HEDGE_DELAY: float = 3.0
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    LLM_REPAIR_ATTEMPTS: int = 1
+    SQL_CACHE_SIZE: int = 1000
+    SQL_CACHE_TTL: float = 7 * 24 * 3600
+    RESULT_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    RESULT_CACHE_MAX_ENTRY_BYTES: int = 1024 * 1024
+    RESULT_CACHE_WATERMARK_INTERVAL: float = 5.0
+    SQL_DEFAULT_LIMIT: int = 50
+    QUERY_MAX_COST: float = 5_000_000
+    QUERY_SOFT_COST: float = 500_000
+    QUERY_MAX_ROWS: int = 1_000_000
+    QUERY_SOFT_MAX_ROWS: int = 100
+    QUERY_SOFT_TIMEOUT_MS: int = 5000
+    QUERY_CURSOR_PREFETCH: int = 1000
+    RESULT_INLINE_MAX_ROWS: int = 50
+    RESULT_INLINE_MAX_BYTES: int = 3000
+    RESULT_PREVIEW_ROWS: int = 5
+    EXPORT_FORMAT: str = "csv"
+    EXPORT_DIR: str = str(BASE_DIR / "bot" / "exports")
+    EXPORT_MAX_AGE: float = 3600.0
+    COLUMNAR_ENABLED: bool = False
+    COLUMNAR_DIR: str = str(BASE_DIR / "bot" / "columnar")
+    COLUMNAR_MAX_SEGMENTS: int = 8
+    COLUMNAR_REFRESH_INTERVAL: float = 60.0
+    METRICS_ENABLED: bool = True
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9108
+    BOT_MODE: str = "polling"
+    DROP_PENDING_UPDATES: bool = False
+    WEBHOOK_BASE_URL: str | None = None
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_SECRET: str | None = None
+    WEBHOOK_SSL_CERT: str | None = None
+    WEBHOOK_SSL_KEY: str | None = None
+    WEBHOOK_LOCAL: bool = False
+    WEBAPP_HOST: str = "0.0.0.0"
+    WEBAPP_PORT: int = 8080
+    WEB_WORKERS: int = 1
+    DRAIN_TIMEOUT: float = 30.0
+    RATE_USER_PER_MINUTE: float = 6.0
+    RATE_USER_BURST: int = 3
+    RATE_GLOBAL_PER_SECOND: float = 5.0
+    RATE_GLOBAL_BURST: int = 20
+    RATE_MAX_WAIT: float = 30.0
+    STATUS_EDIT_INTERVAL: float = 1.5
     model_config = SettingsConfigDict(
         env_file=ENV_PATH,
         extra='allow'
@@ -31,6 +103,10 @@ class Settings(BaseSettings):
     def DB_URL(self) -> str:
         return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+    @property
+    def PG_DSN(self) -> str:
+        return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+
 settings = Settings()
 
 
@@ -42,4 +118,13 @@ dp = Dispatcher(storage=MemoryStorage())
 database_url = settings.DB_URL
 
 log_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log.txt')
-logger.add(log_file_path, format=settings.FORMAT_LOG, level='INFO', rotation=settings.LOG_ROTATION)
\ No newline at end of file
+logger.add(log_file_path, format=settings.FORMAT_LOG, level='INFO', rotation=settings.LOG_ROTATION)
+
+trace_log_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log.json')
+logger.add(
+    trace_log_path,
+    serialize=True,
+    level='INFO',
+    rotation=settings.LOG_ROTATION,
+    filter=lambda record: 'trace_id' in record['extra'],
+)
\ No newline at end of file
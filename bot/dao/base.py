@@ -1,8 +1,9 @@
-from typing import List, Any, TypeVar, Generic
+from typing import List, Any, AsyncIterator, Iterable, Sequence, TypeVar, Generic
 from pydantic import BaseModel
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.future import select
-from sqlalchemy import update as sqlalchemy_update, delete as sqlalchemy_delete, func
+from sqlalchemy import update as sqlalchemy_update, delete as sqlalchemy_delete, func, any_, bindparam, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession
 from dao.models import User
@@ -12,6 +13,9 @@ from dao.database import Base
 # Объявляем типовой параметр T с ограничением, что это наследник Base
 T = TypeVar("T", bound=Base)
 
+# asyncpg не принимает больше 32767 параметров в одном запросе
+MAX_QUERY_PARAMS = 32767
+
 
 class BaseDAO(Generic[T]):
     model: type[T]
@@ -19,26 +23,26 @@ class BaseDAO(Generic[T]):
     @classmethod
     async def find_one_or_none(cls, session: AsyncSession, filters: BaseModel):
         filters_dict = filters.model_dump(exclude_unset=True)
-        logger.info(f'Проводим поиск по {filters_dict}')
+        logger.info('Проводим поиск по {}', filters_dict)
         try:
             query = select(cls.model).filter_by(**filters_dict)
             result = await session.execute(query)
             record = result.scalar_one_or_none()
             if record:
-                logger.info(f'Запись найдена по фильтрам {filters_dict}')
+                logger.info('Запись найдена по фильтрам {}', filters_dict)
             else:
-                logger.info(f'Запись по фильтрам {filters_dict} не найдена(')
+                logger.info('Запись по фильтрам {} не найдена(', filters_dict)
             
             return record
         
         except SQLAlchemyError as e:
-            logger.error(f'Поиск неудался, ошибка {e}')
+            logger.error('Поиск неудался, ошибка {}', e)
             await session.rollback()
             raise e
     
     @classmethod
     async def find_one_or_none_by_id(cls, session: AsyncSession, data_id: int):
-        logger.info (f'Проводим поиск по id {data_id}')
+        logger.info('Проводим поиск по id {}', data_id)
         try:
             query = select(cls.model).filter_by(id=data_id)
             result = await session.execute(query)
@@ -51,7 +55,7 @@ class BaseDAO(Generic[T]):
     @classmethod
     async def delete (cls, session: AsyncSession, filter: BaseModel):
         filter_dict = filter.model_dump(exclude_unset=True)
-        logger.info(f'Удаление записей {cls.model.__name__} по фильтру {filter_dict}')
+        logger.info('Удаление записей {} по фильтру {}', cls.model.__name__, filter_dict)
         if not filter_dict:
             logger.error('Нужен хотя бы один фильтр для удаления')
             raise ValueError ('Нужен хотя бы один фильтр')
@@ -60,22 +64,132 @@ class BaseDAO(Generic[T]):
         try:
             result = await session.execute(query)
             await session.flush()
-            logger.info(f'Удалено {result.rowcount} записей')
+            logger.info('Удалено {} записей', result.rowcount)
             return result.rowcount
         except SQLAlchemyError as e:
             await session.rollback()
-            logger.error(f'Ошибка при удалении записей {e}')
+            logger.error('Ошибка при удалении записей {}', e)
             raise e
     
     @classmethod
     async def count(cls, session: AsyncSession, filter: BaseModel | None = None):
         filter_dict = filter.model_dump(exclude_unset=True) if filter else {}
-        logger.info(f'Подсчитываем записи {cls.model.__name__} по фильтру {filter_dict}')
+        logger.info('Подсчитываем записи {} по фильтру {}', cls.model.__name__, filter_dict)
         try:
-            query = select(func.count(cls.model)).filter_by(**filter_dict)
+            query = select(func.count()).select_from(cls.model).filter_by(**filter_dict)
             result = await session.execute(query)
             count = result.scalar()
-            logger.info (f'Найдено {count}')
+            logger.info('Найдено {}', count)
+            return count
         except SQLAlchemyError as e:
-            logger.error(f'Ошибка при подсчете записей {e}')
-            raise e
\ No newline at end of file
+            logger.error('Ошибка при подсчете записей {}', e)
+            raise e
+
+    @classmethod
+    async def upsert_many(
+        cls,
+        session: AsyncSession,
+        rows: Sequence[dict],
+        index_elements: Sequence[str] | None = None,
+        update_columns: Sequence[str] | None = None,
+        batch_size: int = 1000,
+    ) -> int:
+        """INSERT ... ON CONFLICT DO UPDATE пачками; по умолчанию конфликт по первичному ключу."""
+        if not rows:
+            return 0
+        table = cls.model.__table__
+        index_elements = list(index_elements or (c.name for c in table.primary_key.columns))
+        columns = list(rows[0])
+        if update_columns is None:
+            update_columns = [c for c in columns if c not in index_elements]
+        batch_size = max(1, min(batch_size, MAX_QUERY_PARAMS // len(columns)))
+
+        logger.info('Upsert {} строк в {} пачками по {}', len(rows), table.name, batch_size)
+        total = 0
+        try:
+            for start in range(0, len(rows), batch_size):
+                stmt = pg_insert(table).values(list(rows[start:start + batch_size]))
+                if update_columns:
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=index_elements,
+                        set_={c: stmt.excluded[c] for c in update_columns},
+                    )
+                else:
+                    stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+                result = await session.execute(stmt)
+                total += result.rowcount
+            await session.flush()
+            logger.info('Upsert в {} затронул {} строк', table.name, total)
+            return total
+        except SQLAlchemyError as e:
+            logger.error('Ошибка при upsert в {}: {}', table.name, e)
+            await session.rollback()
+            raise e
+
+    @classmethod
+    async def find_many_by_ids(cls, session: AsyncSession, ids: Iterable[Any], chunk_size: int = 5000) -> list[T]:
+        """Ищет записи по списку id: один параметр-массив на пачку (= ANY(:ids))."""
+        ids = list(dict.fromkeys(ids))
+        logger.info('Ищем {} записей {} по id', len(ids), cls.model.__name__)
+        pk = cls.model.__table__.c.id
+        records: list[T] = []
+        try:
+            for start in range(0, len(ids), chunk_size):
+                chunk = ids[start:start + chunk_size]
+                query = select(cls.model).where(pk == any_(bindparam('ids', chunk, type_=ARRAY(pk.type))))
+                result = await session.execute(query)
+                records.extend(result.scalars().all())
+            logger.info('Найдено {} из {}', len(records), len(ids))
+            return records
+        except SQLAlchemyError as e:
+            logger.error('Поиск по id неудался, ошибка {}', e)
+            await session.rollback()
+            raise e
+
+    @classmethod
+    async def iter_batches(
+        cls,
+        session: AsyncSession,
+        filters: BaseModel | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[list[T]]:
+        """Обходит таблицу пачками по первичному ключу (keyset, без OFFSET)."""
+        filter_dict = filters.model_dump(exclude_unset=True) if filters else {}
+        key_columns = list(cls.model.__table__.primary_key.columns)
+        key = key_columns[0] if len(key_columns) == 1 else tuple_(*key_columns)
+        logger.info('Обходим {} пачками по {}, фильтр {}', cls.model.__name__, batch_size, filter_dict)
+
+        last = None
+        batches = 0
+        while True:
+            query = select(cls.model).filter_by(**filter_dict).order_by(*key_columns).limit(batch_size)
+            if last is not None:
+                query = query.where(key > last)
+            try:
+                result = await session.execute(query)
+            except SQLAlchemyError as e:
+                logger.error('Ошибка при обходе {}: {}', cls.model.__name__, e)
+                await session.rollback()
+                raise e
+            batch = list(result.scalars().all())
+            if not batch:
+                break
+            batches += 1
+            # ключ читаем до yield: после commit/rollback у вызывающего атрибуты истекут
+            values = [getattr(batch[-1], c.key) for c in key_columns]
+            last = values[0] if len(values) == 1 else tuple_(*values)
+            yield batch
+            if len(batch) < batch_size:
+                break
+        logger.debug('Обход {} завершён: {} пачек', cls.model.__name__, batches)
+
+    @classmethod
+    async def iter_all(
+        cls,
+        session: AsyncSession,
+        filters: BaseModel | None = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[T]:
+        async for batch in cls.iter_batches(session, filters, batch_size):
+            for record in batch:
+                yield record
@@ -9,3 +9,14 @@ from sqlalchemy.orm import selectinload
 from dao.base import BaseDAO
 from dao.models import User, Video_Snapshots, Videos
 
+
+class UserDAO(BaseDAO[User]):
+    model = User
+
+
+class VideosDAO(BaseDAO[Videos]):
+    model = Videos
+
+
+class VideoSnapshotsDAO(BaseDAO[Video_Snapshots]):
+    model = Video_Snapshots
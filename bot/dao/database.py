@@ -1,5 +1,5 @@
 from datetime import datetime
-from config import database_url
+from config import database_url, settings
 from sqlalchemy import func, TIMESTAMP, Integer
 from sqlalchemy.orm import Mapped, mapped_column, DeclarativeBase
 from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine, AsyncSession
@@ -8,6 +8,11 @@ engine = create_async_engine(url=database_url)
 
 async_session_maker = async_sessionmaker(engine, class_=AsyncSession)
 
+# read-only хендлеры ходят в реплику, если она задана
+replica_engine = create_async_engine(url=settings.DB_REPLICA_URL) if settings.DB_REPLICA_URL else engine
+
+async_replica_session_maker = async_sessionmaker(replica_engine, class_=AsyncSession)
+
 class Base (AsyncAttrs, DeclarativeBase):
     __abstract__ = True
     
@@ -1,40 +1,68 @@
 from typing import Dict, Callable, Any, Awaitable
 from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
 from aiogram.types import Message, CallbackQuery
-from dao.database import async_session_maker
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from dao.database import async_session_maker, async_replica_session_maker
+
+
+class LazySession:
+    """Сессия, которая открывается только при первом обращении к get()."""
+
+    def __init__(self, maker: async_sessionmaker, read_only: bool) -> None:
+        self.maker = maker
+        self.read_only = read_only
+        self._session: AsyncSession | None = None
+
+    @property
+    def opened(self) -> bool:
+        return self._session is not None
+
+    async def get(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self.maker()
+            if self.read_only:
+                await self._session.execute(text('SET TRANSACTION READ ONLY'))
+        return self._session
+
+    async def finish(self, failed: bool) -> None:
+        if self._session is None:
+            return
+        try:
+            if failed or self.read_only:
+                await self._session.rollback()
+            else:
+                await self._session.commit()
+        finally:
+            await self._session.close()
+            self._session = None
+
+
+class DatabaseMiddleware(BaseMiddleware):
+    """Кладёт в data['session'] ленивую сессию.
+
+    Режим задаётся флагом хендлера: flags={'db': 'write'} — сессия к основной
+    базе с коммитом после хендлера; по умолчанию — read-only сессия к реплике
+    (или к основной базе, если реплика не задана), которая не коммитится.
+    """
 
-class BaseDatabaseMiddleware(BaseMiddleware):
     async def __call__(
         self,
         handler: Callable[[Message | CallbackQuery, Dict[str, Any]], Awaitable[Any]],
         event: Message | CallbackQuery,
         data: Dict[str, Any]
     ) -> Any:
-        async with async_session_maker() as session:
-            self.set_session(data, session) 
-            try:
-                result = await handler(event, data)  
-                await self.after_handler(session) 
-                return result
-            except Exception as e:
-                await session.rollback()  
-                raise e
-            finally:
-                await session.close()  
-    
-    def set_session(self, data: Dict[str, Any], session) -> None:
-        raise NotImplementedError('Этот метод должен быть вызван в подклассах')     
-    
-    async def after_handler(self, session) -> None:
-        pass
-
-class DatabaseMiddlewareWithoutCommit(BaseDatabaseMiddleware):
-    def set_session(self, data: Dict[str, Any], session) -> None:
-        data['session_without_commit'] = session
-
-class DatabaseMiddlewareWithCommit(BaseDatabaseMiddleware):
-    def set_session(self, data: Dict[str, Any], session) -> None:
-        data['session_with_commit'] = session
-    
-    async def after_handler(self, session) -> None:
-        await session.commit()
\ No newline at end of file
+        if get_flag(data, 'db', default='read') == 'write':
+            session = LazySession(async_session_maker, read_only=False)
+        else:
+            session = LazySession(async_replica_session_maker, read_only=True)
+
+        data['session'] = session
+        failed = True
+        try:
+            result = await handler(event, data)
+            failed = False
+            return result
+        finally:
+            await session.finish(failed)
@@ -0,0 +1,195 @@
+"""Потоковая загрузка videos.json в таблицы videos / video_snapshots.
+
+Файл читается кусками, видео разбираются по одному, строки копятся пачками
+и пишутся через COPY во временные staging-таблицы, откуда переносятся
+в основные таблицы через INSERT ... ON CONFLICT DO UPDATE. Повторный запуск
+на том же файле ничего не дублирует.
+
+Запуск из каталога bot:
+    python -m dao.loader ../videos.json --batch-size 50000
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+import asyncpg
+from loguru import logger
+from sqlalchemy import BigInteger, DateTime, Integer, Table
+
+from config import settings
+from dao.models import Videos, Video_Snapshots
+from dao.partitions import ensure_partitions
+from dao.rollup import refresh_daily_stats
+
+DEFAULT_BATCH_SIZE = 50_000
+READ_CHUNK_SIZE = 1 << 20
+
+_VIDEOS_ARRAY = re.compile(r'"videos"\s*:\s*\[')
+_WS = ' \t\r\n'
+
+
+def iter_videos(path: str | Path, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[dict]:
+    """Отдаёт объекты из массива videos по одному, не загружая весь файл в память."""
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as f:
+        buf = ''
+        while True:
+            match = _VIDEOS_ARRAY.search(buf)
+            if match:
+                buf = buf[match.end():]
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ValueError(f'В файле {path} не найден массив "videos"')
+            # ключ может оказаться разрезан на границе чанков
+            buf = buf[-16:] + chunk
+
+        pos = 0
+        eof = False
+        while True:
+            while pos < len(buf) and buf[pos] in _WS + ',':
+                pos += 1
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    eof = True
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            yield obj
+            pos = end
+            if pos > chunk_size:
+                buf = buf[pos:]
+                pos = 0
+
+
+def _converter(column) -> Callable[[Any], Any]:
+    if isinstance(column.type, (BigInteger, Integer)):
+        return int
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat
+    return str
+
+
+class _TableSpec:
+    def __init__(self, table: Table) -> None:
+        self.name = table.name
+        self.stage = f'{table.name}_stage'
+        self.columns = [c.name for c in table.columns]
+        self.key = [c.name for c in table.primary_key.columns]
+        self.converters = [_converter(c) for c in table.columns]
+
+    def to_record(self, item: dict) -> tuple:
+        return tuple(
+            None if item.get(col) is None else conv(item[col])
+            for col, conv in zip(self.columns, self.converters)
+        )
+
+    @property
+    def upsert_sql(self) -> str:
+        cols = ', '.join(self.columns)
+        key = ', '.join(self.key)
+        updates = ', '.join(f'{c} = EXCLUDED.{c}' for c in self.columns if c not in self.key)
+        return (
+            f'INSERT INTO {self.name} ({cols}) '
+            f'SELECT DISTINCT ON ({key}) {cols} FROM {self.stage} '
+            f'ON CONFLICT ({key}) DO UPDATE SET {updates}'
+        )
+
+
+VIDEOS = _TableSpec(Videos.__table__)
+SNAPSHOTS = _TableSpec(Video_Snapshots.__table__)
+_SNAPSHOT_CREATED_AT = SNAPSHOTS.columns.index('created_at')
+
+
+async def _prepare_staging(conn: asyncpg.Connection) -> None:
+    for spec in (VIDEOS, SNAPSHOTS):
+        await conn.execute(
+            f'CREATE TEMP TABLE IF NOT EXISTS {spec.stage} '
+            f'(LIKE {spec.name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS'
+        )
+
+
+async def _flush(conn: asyncpg.Connection, videos: list[tuple], snapshots: list[tuple]) -> None:
+    async with conn.transaction():
+        for spec, records in ((VIDEOS, videos), (SNAPSHOTS, snapshots)):
+            if not records:
+                continue
+            await conn.copy_records_to_table(spec.stage, records=records, columns=spec.columns)
+            await conn.execute(spec.upsert_sql)
+
+
+async def load_videos(
+    conn: asyncpg.Connection,
+    path: str | Path,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> tuple[int, int]:
+    """Загружает файл в БД пачками и возвращает (число видео, число снапшотов).
+
+    После загрузки пересчитывает video_daily_stats за дни, в которые попали снапшоты.
+    """
+    await _prepare_staging(conn)
+
+    videos: list[tuple] = []
+    snapshots: list[tuple] = []
+    days: set[date] = set()
+    total_videos = total_snapshots = 0
+    started = time.perf_counter()
+
+    for item in iter_videos(path):
+        videos.append(VIDEOS.to_record(item))
+        for snap in item.get('snapshots') or ():
+            snap.setdefault('video_id', item['id'])
+            record = SNAPSHOTS.to_record(snap)
+            snapshots.append(record)
+            days.add(record[_SNAPSHOT_CREATED_AT].astimezone(timezone.utc).date())
+
+        if len(videos) + len(snapshots) >= batch_size:
+            await ensure_partitions(conn, days)
+            await _flush(conn, videos, snapshots)
+            total_videos += len(videos)
+            total_snapshots += len(snapshots)
+            logger.info('Загружено видео: {}, снапшотов: {}', total_videos, total_snapshots)
+            videos.clear()
+            snapshots.clear()
+
+    await ensure_partitions(conn, days)
+    await _flush(conn, videos, snapshots)
+    total_videos += len(videos)
+    total_snapshots += len(snapshots)
+    await refresh_daily_stats(conn, days)
+
+    logger.info(
+        'Загрузка {} завершена: видео {}, снапшотов {}, за {:.1f} c',
+        path, total_videos, total_snapshots, time.perf_counter() - started,
+    )
+    return total_videos, total_snapshots
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description='Загрузка videos.json в Postgres')
+    parser.add_argument('path', type=Path, help='путь к videos.json')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='сколько строк копить перед COPY')
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(settings.PG_DSN)
+    try:
+        await load_videos(conn, args.path, batch_size=args.batch_size)
+    finally:
+        await conn.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
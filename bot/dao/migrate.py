@@ -0,0 +1,70 @@
+"""Применение миграций из dao/migrations по порядку имён.
+
+Миграция — это .sql-файл или .py-модуль с функцией
+``async def upgrade(conn)`` для шагов, которые зависят от настроек или
+данных. Применённые миграции записываются в bot_service.schema_migrations,
+каждая выполняется в своей транзакции.
+
+Запуск из каталога bot:
+    python -m dao.migrate
+"""
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import asyncpg
+from loguru import logger
+
+from config import settings
+from dao.pool import execute_ddl
+
+MIGRATIONS_DIR = Path(__file__).parent / 'migrations'
+
+DDL = """
+    CREATE SCHEMA IF NOT EXISTS bot_service;
+    CREATE TABLE IF NOT EXISTS bot_service.schema_migrations (
+        name text PRIMARY KEY,
+        applied_at timestamptz NOT NULL DEFAULT now()
+    );
+"""
+
+
+def _load(path: Path):
+    spec = importlib.util.spec_from_file_location(f'dao.migrations.{path.stem}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+async def migrate(conn: asyncpg.Connection) -> list[str]:
+    await execute_ddl(conn, DDL)
+    applied = {r['name'] for r in await conn.fetch('SELECT name FROM bot_service.schema_migrations')}
+
+    done = []
+    paths = sorted(p for p in MIGRATIONS_DIR.iterdir() if p.suffix in ('.sql', '.py'))
+    for path in paths:
+        if path.name in applied:
+            continue
+        logger.info('Применяем миграцию {}', path.name)
+        async with conn.transaction():
+            if path.suffix == '.py':
+                await _load(path).upgrade(conn)
+            else:
+                await conn.execute(path.read_text(encoding='utf-8'))
+            await conn.execute('INSERT INTO bot_service.schema_migrations (name) VALUES ($1)', path.name)
+        done.append(path.name)
+
+    logger.info('Миграций применено: {}', len(done))
+    return done
+
+
+async def main() -> None:
+    conn = await asyncpg.connect(settings.PG_DSN)
+    try:
+        await migrate(conn)
+    finally:
+        await conn.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
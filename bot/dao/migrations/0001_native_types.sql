@@ -0,0 +1,29 @@
+-- Счётчики в BIGINT, даты в TIMESTAMPTZ, индексы под фильтры по времени
+
+ALTER TABLE videos
+    ALTER COLUMN video_created_at TYPE timestamptz USING video_created_at::timestamptz,
+    ALTER COLUMN views_count TYPE bigint USING views_count::bigint,
+    ALTER COLUMN likes_count TYPE bigint USING likes_count::bigint,
+    ALTER COLUMN comments_count TYPE bigint USING comments_count::bigint,
+    ALTER COLUMN reports_count TYPE bigint USING reports_count::bigint,
+    ALTER COLUMN created_at TYPE timestamptz USING created_at::timestamptz,
+    ALTER COLUMN updated_at TYPE timestamptz USING updated_at::timestamptz;
+
+ALTER TABLE video_snapshots
+    ALTER COLUMN views_count TYPE bigint USING views_count::bigint,
+    ALTER COLUMN likes_count TYPE bigint USING likes_count::bigint,
+    ALTER COLUMN comments_count TYPE bigint USING comments_count::bigint,
+    ALTER COLUMN reports_count TYPE bigint USING reports_count::bigint,
+    ALTER COLUMN delta_views_count TYPE bigint USING delta_views_count::bigint,
+    ALTER COLUMN delta_likes_count TYPE bigint USING delta_likes_count::bigint,
+    ALTER COLUMN delta_comments_count TYPE bigint USING delta_comments_count::bigint,
+    ALTER COLUMN delta_reports_count TYPE bigint USING delta_reports_count::bigint,
+    ALTER COLUMN created_at TYPE timestamptz USING created_at::timestamptz,
+    ALTER COLUMN updated_at TYPE timestamptz USING updated_at::timestamptz;
+
+CREATE INDEX IF NOT EXISTS ix_video_snapshots_video_id_created_at ON video_snapshots (video_id, created_at);
+CREATE INDEX IF NOT EXISTS ix_video_snapshots_created_at ON video_snapshots (created_at);
+CREATE INDEX IF NOT EXISTS ix_videos_creator_id_video_created_at ON videos (creator_id, video_created_at);
+
+ANALYZE videos;
+ANALYZE video_snapshots;
@@ -0,0 +1,41 @@
+-- Дневной срез по видео: последние значения счётчиков за день и прирост к предыдущему дню
+
+CREATE TABLE IF NOT EXISTS video_daily_stats (
+    video_id text NOT NULL REFERENCES videos (id),
+    day date NOT NULL,
+    views_count bigint NOT NULL,
+    likes_count bigint NOT NULL,
+    comments_count bigint NOT NULL,
+    reports_count bigint NOT NULL,
+    delta_views_count bigint NOT NULL,
+    delta_likes_count bigint NOT NULL,
+    delta_comments_count bigint NOT NULL,
+    delta_reports_count bigint NOT NULL,
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (video_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS ix_video_daily_stats_day ON video_daily_stats (day);
+
+INSERT INTO video_daily_stats (
+    video_id, day, views_count, likes_count, comments_count, reports_count,
+    delta_views_count, delta_likes_count, delta_comments_count, delta_reports_count
+)
+SELECT
+    video_id, day, views_count, likes_count, comments_count, reports_count,
+    views_count - coalesce(lag(views_count) OVER w, 0),
+    likes_count - coalesce(lag(likes_count) OVER w, 0),
+    comments_count - coalesce(lag(comments_count) OVER w, 0),
+    reports_count - coalesce(lag(reports_count) OVER w, 0)
+FROM (
+    SELECT DISTINCT ON (video_id, (created_at AT TIME ZONE 'UTC')::date)
+        video_id,
+        (created_at AT TIME ZONE 'UTC')::date AS day,
+        views_count, likes_count, comments_count, reports_count
+    FROM video_snapshots
+    ORDER BY video_id, (created_at AT TIME ZONE 'UTC')::date, created_at DESC
+) last_per_day
+WINDOW w AS (PARTITION BY video_id ORDER BY day)
+ON CONFLICT (video_id, day) DO NOTHING;
+
+ANALYZE video_daily_stats;
@@ -0,0 +1,77 @@
+"""video_snapshots -> секционированная по created_at таблица (см. dao/partitions.py).
+
+В секционированной таблице первичный ключ обязан включать столбец
+секционирования, поэтому ключ становится (id, created_at). Старая таблица
+переименовывается, строки переливаются в новую одним INSERT ... SELECT,
+секции заранее создаются на весь диапазон данных и на
+SNAPSHOT_PARTITIONS_AHEAD интервалов вперёд.
+"""
+from datetime import datetime, timezone
+
+import asyncpg
+
+from config import settings
+from dao.partitions import DEFAULT_PARTITION, TABLE, days_between, ensure_partitions, is_partitioned, upcoming
+
+OLD_TABLE = f'{TABLE}_unpartitioned'
+COLUMNS = (
+    'id, video_id, views_count, likes_count, comments_count, reports_count, '
+    'delta_views_count, delta_likes_count, delta_comments_count, delta_reports_count, '
+    'created_at, updated_at'
+)
+
+CREATE_SQL = f"""
+    CREATE TABLE {TABLE} (
+        id text NOT NULL,
+        video_id text NOT NULL REFERENCES videos (id),
+        views_count bigint,
+        likes_count bigint,
+        comments_count bigint,
+        reports_count bigint,
+        delta_views_count bigint,
+        delta_likes_count bigint,
+        delta_comments_count bigint,
+        delta_reports_count bigint,
+        created_at timestamptz NOT NULL,
+        updated_at timestamptz,
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+
+    CREATE INDEX ix_video_snapshots_video_id_created_at ON {TABLE} (video_id, created_at);
+    CREATE INDEX ix_video_snapshots_created_at ON {TABLE} (created_at);
+    CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT;
+"""
+
+TRIGGER_SQL = f"""
+    CREATE OR REPLACE TRIGGER video_snapshots_data_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {TABLE}
+        FOR EACH STATEMENT EXECUTE FUNCTION bot_service.bump_data_version()
+"""
+
+
+async def upgrade(conn: asyncpg.Connection) -> None:
+    if await is_partitioned(conn):
+        return
+
+    exists = await conn.fetchval('SELECT to_regclass($1) IS NOT NULL', TABLE)
+    if exists:
+        await conn.execute(f'ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}')
+        # имена индексов общие на схему: освобождаем их для новой таблицы
+        for name in await conn.fetch('SELECT indexname FROM pg_indexes WHERE tablename = $1', OLD_TABLE):
+            await conn.execute(f'ALTER INDEX {name["indexname"]} RENAME TO {name["indexname"]}_unpartitioned')
+
+    await conn.execute(CREATE_SQL)
+
+    if exists:
+        first, last = await conn.fetchrow(f'SELECT min(created_at), max(created_at) FROM {OLD_TABLE}')
+        if first is not None:
+            first, last = (v.astimezone(timezone.utc).date() for v in (first, last))
+            await ensure_partitions(conn, days_between(first, last))
+        await conn.execute(f'INSERT INTO {TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM {OLD_TABLE}')
+        await conn.execute(f'DROP TABLE {OLD_TABLE}')
+
+    today = datetime.now(timezone.utc).date()
+    await ensure_partitions(conn, upcoming(today, settings.SNAPSHOT_PARTITION_INTERVAL))
+    if await conn.fetchval("SELECT to_regproc('bot_service.bump_data_version') IS NOT NULL"):
+        await conn.execute(TRIGGER_SQL)
+    await conn.execute(f'ANALYZE {TABLE}')
@@ -1,7 +1,8 @@
+from datetime import date, datetime
 from typing import Optional
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import BigInteger, Text, ForeignKey
-from bot.dao.database import Base
+from sqlalchemy import BigInteger, Date, DateTime, Text, ForeignKey, Index, func
+from dao.database import Base
 
 
 class User(Base):
@@ -18,16 +19,19 @@ class User(Base):
 
 class Videos(Base):
     __tablename__ = 'videos'
+    __table_args__ = (
+        Index('ix_videos_creator_id_video_created_at', 'creator_id', 'video_created_at'),
+    )
     
     id: Mapped[str] = mapped_column(Text, primary_key=True, autoincrement=False) 
     creator_id: Mapped[str] = mapped_column(Text, index=True, nullable=False)
-    video_created_at: Mapped[str] = mapped_column(Text)
-    views_count: Mapped[str] = mapped_column(Text)
-    likes_count: Mapped[str] = mapped_column(Text)
-    comments_count: Mapped[str] = mapped_column(Text)
-    reports_count: Mapped[str] = mapped_column(Text)
-    created_at: Mapped[str] = mapped_column(Text)
-    updated_at: Mapped[str] = mapped_column(Text)
+    video_created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    views_count: Mapped[int] = mapped_column(BigInteger)
+    likes_count: Mapped[int] = mapped_column(BigInteger)
+    comments_count: Mapped[int] = mapped_column(BigInteger)
+    reports_count: Mapped[int] = mapped_column(BigInteger)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
     video_snap: Mapped['Video_Snapshots'] = relationship(
         'Video_Snapshots',
         back_populates='video',
@@ -38,17 +42,39 @@ class Videos(Base):
 
 class Video_Snapshots(Base):
     __tablename__ = 'video_snapshots'
+    __table_args__ = (
+        Index('ix_video_snapshots_video_id_created_at', 'video_id', 'created_at'),
+        Index('ix_video_snapshots_created_at', 'created_at'),
+        # секции и их обслуживание — dao/partitions.py, ключ включает created_at
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
     
     id: Mapped[str] = mapped_column(Text, primary_key=True, autoincrement=False)  
     video_id: Mapped[str] = mapped_column(ForeignKey('videos.id'), nullable=False)
-    views_count: Mapped[str] = mapped_column(Text)
-    likes_count: Mapped[str] = mapped_column(Text)
-    comments_count: Mapped[str] = mapped_column(Text)
-    reports_count: Mapped[str] = mapped_column(Text)
-    delta_views_count: Mapped[str] = mapped_column(Text)
-    delta_likes_count: Mapped[str] = mapped_column(Text)
-    delta_comments_count: Mapped[str] = mapped_column(Text)
-    delta_reports_count: Mapped[str] = mapped_column(Text)
-    created_at: Mapped[str] = mapped_column(Text)
-    updated_at: Mapped[str] = mapped_column(Text)
-    video: Mapped['Videos'] = relationship('Videos', back_populates='video_snap')
\ No newline at end of file
+    views_count: Mapped[int] = mapped_column(BigInteger)
+    likes_count: Mapped[int] = mapped_column(BigInteger)
+    comments_count: Mapped[int] = mapped_column(BigInteger)
+    reports_count: Mapped[int] = mapped_column(BigInteger)
+    delta_views_count: Mapped[int] = mapped_column(BigInteger)
+    delta_likes_count: Mapped[int] = mapped_column(BigInteger)
+    delta_comments_count: Mapped[int] = mapped_column(BigInteger)
+    delta_reports_count: Mapped[int] = mapped_column(BigInteger)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    video: Mapped['Videos'] = relationship('Videos', back_populates='video_snap')
+
+
+class Video_Daily_Stats(Base):
+    __tablename__ = 'video_daily_stats'
+    
+    video_id: Mapped[str] = mapped_column(ForeignKey('videos.id'), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True, index=True)
+    views_count: Mapped[int] = mapped_column(BigInteger)
+    likes_count: Mapped[int] = mapped_column(BigInteger)
+    comments_count: Mapped[int] = mapped_column(BigInteger)
+    reports_count: Mapped[int] = mapped_column(BigInteger)
+    delta_views_count: Mapped[int] = mapped_column(BigInteger)
+    delta_likes_count: Mapped[int] = mapped_column(BigInteger)
+    delta_comments_count: Mapped[int] = mapped_column(BigInteger)
+    delta_reports_count: Mapped[int] = mapped_column(BigInteger)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
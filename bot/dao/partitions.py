@@ -0,0 +1,254 @@
+"""Секции video_snapshots по времени снапшота.
+
+video_snapshots разбита RANGE по created_at на секции по месяцу или дню
+(SNAPSHOT_PARTITION_INTERVAL), границы — полночь UTC. Запрос с условием на
+created_at читает только секции из своего диапазона. Строки, для которых
+секции ещё нет, попадают в video_snapshots_default; когда секция
+создаётся, такие строки переносятся в неё.
+
+maintain() создаёт секции на SNAPSHOT_PARTITIONS_AHEAD интервалов вперёд
+и, если задан SNAPSHOT_RETENTION (сколько интервалов хранить, 0 — всё),
+отцепляет (detach) или удаляет (drop) более старые секции. Отцепленная
+секция остаётся обычной таблицей, её можно выгрузить и удалить вручную.
+Бот вызывает maintain() раз в PARTITION_MAINTENANCE_INTERVAL секунд.
+
+Запуск из каталога bot (например, из cron или перед заливкой архива):
+    python -m dao.partitions
+    python -m dao.partitions --from 2025-01-01 --to 2025-12-31
+"""
+import argparse
+import asyncio
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable
+
+import asyncpg
+from loguru import logger
+
+from config import settings
+from dao.pool import acquire
+
+TABLE = 'video_snapshots'
+DEFAULT_PARTITION = f'{TABLE}_default'
+INTERVALS = ('day', 'month')
+# ключ pg_advisory_xact_lock: секциями одновременно занимается один процесс
+LOCK_KEY = 0x76736E70
+
+PARTITIONS_SQL = """
+    SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = $1::regclass
+    ORDER BY c.relname
+"""
+
+BUMP_VERSION_SQL = """
+    UPDATE bot_service.data_version SET version = version + 1, updated_at = now() WHERE id = 1
+"""
+
+_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+@dataclass
+class Partition:
+    name: str
+    start: datetime | None
+    end: datetime | None
+
+    @property
+    def is_default(self) -> bool:
+        return self.start is None
+
+
+def _interval(interval: str | None) -> str:
+    interval = interval or settings.SNAPSHOT_PARTITION_INTERVAL
+    if interval not in INTERVALS:
+        raise ValueError(f'Неизвестный интервал секций: {interval!r}, нужен один из {INTERVALS}')
+    return interval
+
+
+def floor(day: date, interval: str) -> date:
+    return day if interval == 'day' else day.replace(day=1)
+
+
+def shift(start: date, interval: str, steps: int = 1) -> date:
+    if interval == 'day':
+        return start + timedelta(days=steps)
+    month = start.year * 12 + start.month - 1 + steps
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def partition_name(start: date, interval: str) -> str:
+    return f'{TABLE}_p{start:%Y%m%d}' if interval == 'day' else f'{TABLE}_p{start:%Y%m}'
+
+
+def days_between(first: date, last: date) -> list[date]:
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def upcoming(today: date, interval: str) -> list[date]:
+    """Начала текущего и SNAPSHOT_PARTITIONS_AHEAD следующих интервалов."""
+    current = floor(today, interval)
+    return [shift(current, interval, i) for i in range(settings.SNAPSHOT_PARTITIONS_AHEAD + 1)]
+
+
+def _bound(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def _literal(value: datetime) -> str:
+    # в DDL параметры не передаются; значение своё, не пользовательское
+    return f"'{value.isoformat()}'"
+
+
+async def is_partitioned(conn: asyncpg.Connection) -> bool:
+    kind = await conn.fetchval(
+        'SELECT relkind::text FROM pg_class WHERE oid = to_regclass($1)', TABLE,
+    )
+    return kind == 'p'
+
+
+async def list_partitions(conn: asyncpg.Connection) -> list[Partition]:
+    partitions = []
+    for r in await conn.fetch(PARTITIONS_SQL, TABLE):
+        match = _BOUND.search(r['bound'])
+        if match is None:
+            partitions.append(Partition(r['name'], None, None))
+        else:
+            start, end = (datetime.fromisoformat(v).astimezone(timezone.utc) for v in match.groups())
+            partitions.append(Partition(r['name'], start, end))
+    return partitions
+
+
+async def _create(conn: asyncpg.Connection, name: str, start: datetime, end: datetime) -> None:
+    bounds = f'FROM ({_literal(start)}) TO ({_literal(end)})'
+    has_default = await conn.fetchval('SELECT to_regclass($1) IS NOT NULL', DEFAULT_PARTITION)
+    stray = has_default and await conn.fetchval(
+        f'SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= $1 AND created_at < $2)',
+        start, end,
+    )
+    if not stray:
+        await conn.execute(f'CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES {bounds}')
+        return
+
+    # секция поверх строк из default: переносим их и только потом подключаем,
+    # иначе Postgres откажется создавать секцию
+    await conn.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    moved = await conn.execute(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= $1 AND created_at < $2 RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved',
+        start, end,
+    )
+    await conn.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES {bounds}')
+    logger.info('Из {} в {} перенесено строк: {}', DEFAULT_PARTITION, name, moved.split()[-1])
+
+
+async def ensure_partitions(
+    conn: asyncpg.Connection,
+    days: Iterable[date],
+    interval: str | None = None,
+) -> list[str]:
+    """Создаёт недостающие секции под указанные дни и возвращает имена созданных."""
+    interval = _interval(interval)
+    starts = sorted({floor(day, interval) for day in days})
+    if not starts or not await is_partitioned(conn):
+        return []
+
+    created = []
+    async with conn.transaction():
+        await conn.execute('SELECT pg_advisory_xact_lock($1)', LOCK_KEY)
+        existing = [p for p in await list_partitions(conn) if not p.is_default]
+        for start in starts:
+            lower, upper = _bound(start), _bound(shift(start, interval))
+            # секция другого интервала (настройку поменяли) уже покрывает этот отрезок
+            if any(p.start < upper and lower < p.end for p in existing):
+                continue
+            name = partition_name(start, interval)
+            await _create(conn, name, lower, upper)
+            existing.append(Partition(name, lower, upper))
+            created.append(name)
+
+    if created:
+        logger.info('Созданы секции {}: {}', TABLE, ', '.join(created))
+    return created
+
+
+async def apply_retention(
+    conn: asyncpg.Connection,
+    today: date,
+    keep: int,
+    mode: str = 'detach',
+    interval: str | None = None,
+) -> list[str]:
+    """Отцепляет или удаляет секции старше keep интервалов, считая текущий."""
+    if mode not in ('detach', 'drop'):
+        raise ValueError(f'Неизвестный режим хранения: {mode!r}, нужен detach или drop')
+    interval = _interval(interval)
+    if keep <= 0 or not await is_partitioned(conn):
+        return []
+
+    cutoff = _bound(shift(floor(today, interval), interval, 1 - keep))
+    removed = []
+    async with conn.transaction():
+        await conn.execute('SELECT pg_advisory_xact_lock($1)', LOCK_KEY)
+        for p in await list_partitions(conn):
+            if p.is_default or p.end > cutoff:
+                continue
+            await conn.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {p.name}')
+            if mode == 'drop':
+                await conn.execute(f'DROP TABLE {p.name}')
+            removed.append(p.name)
+        # DETACH и DROP не вызывают триггеры, кэш результатов сбрасываем сами
+        if removed and await conn.fetchval("SELECT to_regclass('bot_service.data_version') IS NOT NULL"):
+            await conn.execute(BUMP_VERSION_SQL)
+
+    if removed:
+        logger.info(
+            'Секции {} старше {} {}: {}',
+            TABLE, cutoff.date(), 'отцеплены' if mode == 'detach' else 'удалены', ', '.join(removed),
+        )
+    return removed
+
+
+async def maintain(conn: asyncpg.Connection, today: date | None = None) -> None:
+    """Секции на SNAPSHOT_PARTITIONS_AHEAD интервалов вперёд и чистка по SNAPSHOT_RETENTION."""
+    interval = _interval(None)
+    today = today or datetime.now(timezone.utc).date()
+    await ensure_partitions(conn, upcoming(today, interval), interval)
+    await apply_retention(conn, today, settings.SNAPSHOT_RETENTION, settings.SNAPSHOT_RETENTION_MODE, interval)
+
+
+async def run_maintenance(interval: float) -> None:
+    """Фоновая задача бота: maintain() раз в interval секунд."""
+    while True:
+        try:
+            async with acquire() as conn:
+                await maintain(conn)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error('Обслуживание секций {} не удалось: {}', TABLE, e)
+        await asyncio.sleep(interval)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description='Создание и чистка секций video_snapshots')
+    parser.add_argument('--from', dest='start', type=date.fromisoformat,
+                        help='создать секции начиная с этого дня')
+    parser.add_argument('--to', dest='end', type=date.fromisoformat,
+                        help='создать секции по этот день включительно')
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(settings.PG_DSN)
+    try:
+        if args.start:
+            await ensure_partitions(conn, days_between(args.start, args.end or args.start))
+        else:
+            await maintain(conn)
+    finally:
+        await conn.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+"""Общий пул соединений asyncpg для text-to-SQL части бота.
+
+Пул создаётся один раз на процесс в dp.startup и закрывается в dp.shutdown.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import asyncpg
+from loguru import logger
+
+from config import settings
+
+_pool: asyncpg.Pool | None = None
+
+# ключ pg_advisory_xact_lock: служебный DDL при старте воркеры выполняют по очереди,
+# иначе параллельные CREATE SCHEMA / CREATE OR REPLACE падают с
+# "tuple concurrently updated" или дублем ключа в pg_namespace
+DDL_LOCK_KEY = 0x62745F64
+
+
+class PoolMetrics:
+    def __init__(self, window: int = 1000) -> None:
+        self.waiting = 0
+        self.acquired_total = 0
+        self.timeouts_total = 0
+        self.acquire_seconds_total = 0.0
+        self.acquire_seconds_max = 0.0
+        self._recent: deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.acquired_total += 1
+        self.acquire_seconds_total += seconds
+        self.acquire_seconds_max = max(self.acquire_seconds_max, seconds)
+        self._recent.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        if not self._recent:
+            return 0.0
+        ordered = sorted(self._recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+metrics = PoolMetrics()
+
+
+async def init_pool() -> None:
+    global _pool
+    if _pool is not None:
+        return
+    _pool = await asyncpg.create_pool(
+        dsn=settings.PG_DSN,
+        min_size=settings.PG_POOL_MIN_SIZE,
+        max_size=settings.PG_POOL_MAX_SIZE,
+        statement_cache_size=settings.PG_STATEMENT_CACHE_SIZE,
+        server_settings={
+            'statement_timeout': str(settings.PG_STATEMENT_TIMEOUT_MS),
+            'timezone': settings.PG_TIMEZONE,
+        },
+    )
+    logger.info(
+        'Пул соединений создан: min={}, max={}, statement_timeout={} мс',
+        settings.PG_POOL_MIN_SIZE, settings.PG_POOL_MAX_SIZE, settings.PG_STATEMENT_TIMEOUT_MS,
+    )
+
+
+async def close_pool() -> None:
+    global _pool
+    if _pool is None:
+        return
+    logger.info('Закрываем пул соединений, статистика: {}', pool_stats())
+    await _pool.close()
+    _pool = None
+
+
+def get_pool() -> asyncpg.Pool:
+    if _pool is None:
+        raise RuntimeError('Пул соединений не инициализирован, вызовите init_pool()')
+    return _pool
+
+
+@asynccontextmanager
+async def acquire() -> AsyncIterator[asyncpg.Connection]:
+    pool = get_pool()
+    started = time.perf_counter()
+    metrics.waiting += 1
+    try:
+        conn = await pool.acquire(timeout=settings.PG_POOL_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        metrics.timeouts_total += 1
+        logger.warning('Не дождались соединения из пула за {} c', settings.PG_POOL_ACQUIRE_TIMEOUT)
+        raise
+    finally:
+        metrics.waiting -= 1
+    metrics.observe(time.perf_counter() - started)
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+async def execute_ddl(conn: asyncpg.Connection, ddl: str) -> None:
+    async with conn.transaction():
+        await conn.execute('SELECT pg_advisory_xact_lock($1)', DDL_LOCK_KEY)
+        await conn.execute(ddl)
+
+
+def pool_stats() -> dict:
+    size = _pool.get_size() if _pool else 0
+    idle = _pool.get_idle_size() if _pool else 0
+    return {
+        'size': size,
+        'idle': idle,
+        'in_use': size - idle,
+        'max_size': settings.PG_POOL_MAX_SIZE,
+        'waiting': metrics.waiting,
+        'acquired_total': metrics.acquired_total,
+        'timeouts_total': metrics.timeouts_total,
+        'acquire_seconds_total': round(metrics.acquire_seconds_total, 6),
+        'acquire_seconds_max': round(metrics.acquire_seconds_max, 6),
+        'acquire_seconds_p95': round(metrics.percentile(0.95), 6),
+    }
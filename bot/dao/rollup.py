@@ -0,0 +1,114 @@
+"""Инкрементальное обновление дневного среза video_daily_stats.
+
+Для каждого затронутого дня берётся последний снапшот видео за этот день,
+после чего пересчитываются приросты у строк этих видео начиная с самого
+раннего затронутого дня: прирост дня зависит от предыдущего дня, а
+прирост следующего дня — от текущего.
+
+На video_daily_stats нет триггера data_version, а пересчёт идёт уже после
+коммита снапшотов, поэтому версия поднимается в той же транзакции, что и
+пересчёт: иначе ответ по старому срезу попал бы в кэш под новой версией.
+
+Полный пересчёт за период из каталога bot:
+    python -m dao.rollup 2025-11-01 2025-11-30
+"""
+import argparse
+import asyncio
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable
+
+import asyncpg
+from loguru import logger
+
+from config import settings
+
+UPSERT_LAST_VALUES_SQL = """
+    INSERT INTO video_daily_stats (
+        video_id, day, views_count, likes_count, comments_count, reports_count,
+        delta_views_count, delta_likes_count, delta_comments_count, delta_reports_count
+    )
+    SELECT DISTINCT ON (video_id, (created_at AT TIME ZONE 'UTC')::date)
+        video_id,
+        (created_at AT TIME ZONE 'UTC')::date,
+        views_count, likes_count, comments_count, reports_count,
+        0, 0, 0, 0
+    FROM video_snapshots
+    WHERE created_at >= $1 AND created_at < $2
+      AND (created_at AT TIME ZONE 'UTC')::date = ANY($3::date[])
+    ORDER BY video_id, (created_at AT TIME ZONE 'UTC')::date, created_at DESC
+    ON CONFLICT (video_id, day) DO UPDATE
+    SET views_count = EXCLUDED.views_count,
+        likes_count = EXCLUDED.likes_count,
+        comments_count = EXCLUDED.comments_count,
+        reports_count = EXCLUDED.reports_count,
+        updated_at = now()
+"""
+
+UPDATE_DELTAS_SQL = """
+    UPDATE video_daily_stats s
+    SET delta_views_count = s.views_count - coalesce(prev.views_count, 0),
+        delta_likes_count = s.likes_count - coalesce(prev.likes_count, 0),
+        delta_comments_count = s.comments_count - coalesce(prev.comments_count, 0),
+        delta_reports_count = s.reports_count - coalesce(prev.reports_count, 0),
+        updated_at = now()
+    FROM video_daily_stats cur
+    LEFT JOIN LATERAL (
+        SELECT p.views_count, p.likes_count, p.comments_count, p.reports_count
+        FROM video_daily_stats p
+        WHERE p.video_id = cur.video_id AND p.day < cur.day
+        ORDER BY p.day DESC
+        LIMIT 1
+    ) prev ON true
+    WHERE s.video_id = cur.video_id AND s.day = cur.day
+      AND cur.day >= $1
+      AND cur.video_id IN (
+          SELECT video_id FROM video_daily_stats WHERE day = ANY($2::date[])
+      )
+"""
+
+
+BUMP_VERSION_SQL = """
+    UPDATE bot_service.data_version SET version = version + 1, updated_at = now() WHERE id = 1
+"""
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+async def refresh_daily_stats(conn: asyncpg.Connection, days: Iterable[date]) -> int:
+    """Пересчитывает срез за указанные дни и возвращает число обновлённых строк."""
+    days = sorted(set(days))
+    if not days:
+        return 0
+
+    async with conn.transaction():
+        await conn.execute(
+            UPSERT_LAST_VALUES_SQL,
+            _day_start(days[0]), _day_start(days[-1] + timedelta(days=1)), days,
+        )
+        result = await conn.execute(UPDATE_DELTAS_SQL, days[0], days)
+        if await conn.fetchval("SELECT to_regclass('bot_service.data_version') IS NOT NULL"):
+            await conn.execute(BUMP_VERSION_SQL)
+
+    updated = int(result.split()[-1])
+    logger.info('Дневной срез обновлён за {} дн. ({} - {}), строк: {}', len(days), days[0], days[-1], updated)
+    return updated
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description='Пересчёт video_daily_stats за период')
+    parser.add_argument('start', type=date.fromisoformat)
+    parser.add_argument('end', type=date.fromisoformat)
+    args = parser.parse_args()
+
+    days = [args.start + timedelta(days=i) for i in range((args.end - args.start).days + 1)]
+    conn = await asyncpg.connect(settings.PG_DSN)
+    try:
+        await refresh_daily_stats(conn, days)
+    finally:
+        await conn.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""Кэш описания схемы БД для промпта LLM.
+
+Текст схемы строится один раз и перестраивается только когда меняется
+отпечаток каталога (pg_class / pg_attribute). Отпечаток проверяется не
+чаще раза в SCHEMA_CHECK_INTERVAL секунд, а через SCHEMA_CACHE_TTL схема
+перечитывается безусловно.
+"""
+import asyncio
+import time
+
+from loguru import logger
+
+from config import settings
+from dao.pool import acquire
+
+FINGERPRINT_SQL = """
+    SELECT md5(coalesce(string_agg(
+        c.oid::text || ':' || c.relname || ':' || a.attname || ':' || a.atttypid::text,
+        ',' ORDER BY c.oid, a.attnum
+    ), ''))
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid
+    WHERE n.nspname = 'public'
+      AND c.relkind IN ('r', 'p', 'v', 'm')
+      AND NOT c.relispartition
+      AND a.attnum > 0
+      AND NOT a.attisdropped
+"""
+
+COLUMNS_SQL = """
+    SELECT table_name, column_name, data_type
+    FROM information_schema.columns
+    WHERE table_schema = 'public'
+      AND NOT EXISTS (
+          SELECT 1 FROM pg_class c
+          JOIN pg_namespace n ON n.oid = c.relnamespace
+          WHERE n.nspname = table_schema AND c.relname = table_name AND c.relispartition
+      )
+    ORDER BY table_name, ordinal_position
+"""
+
+
+def render_schema(tables: dict[str, list[tuple[str, str]]]) -> str:
+    lines = []
+    for t, cols in tables.items():
+        lines.append(f'TABLE {t}: ' + ', '.join(f'{name} {dtype}' for name, dtype in cols))
+    return '\n'.join(lines)
+
+
+class SchemaCache:
+    def __init__(self, check_interval: float, ttl: float) -> None:
+        self.check_interval = check_interval
+        self.ttl = ttl
+        self.tables: dict[str, list[tuple[str, str]]] = {}
+        self.text: str | None = None
+        self._fingerprint: str | None = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        logger.info('Кэш схемы БД сброшен вручную')
+        self.text = None
+
+    async def get_text(self) -> str:
+        await self._ensure_fresh()
+        return self.text
+
+    async def get_tables(self) -> dict[str, list[tuple[str, str]]]:
+        await self._ensure_fresh()
+        return self.tables
+
+    async def _ensure_fresh(self) -> None:
+        now = time.monotonic()
+        if self.text is not None and now - self._checked_at < self.check_interval:
+            return
+
+        async with self._lock:
+            now = time.monotonic()
+            if self.text is not None and now - self._checked_at < self.check_interval:
+                return
+
+            async with acquire() as conn:
+                fingerprint = await conn.fetchval(FINGERPRINT_SQL)
+                expired = now - self._loaded_at >= self.ttl
+                if self.text is None or expired or fingerprint != self._fingerprint:
+                    rows = await conn.fetch(COLUMNS_SQL)
+                    tables: dict[str, list[tuple[str, str]]] = {}
+                    for r in rows:
+                        tables.setdefault(r['table_name'], []).append((r['column_name'], r['data_type']))
+                    self.tables = tables
+                    self.text = render_schema(tables)
+                    self._fingerprint = fingerprint
+                    self._loaded_at = now
+                    logger.info('Схема БД перечитана: {} таблиц', len(tables))
+            self._checked_at = now
+
+
+schema_cache = SchemaCache(
+    check_interval=settings.SCHEMA_CHECK_INTERVAL,
+    ttl=settings.SCHEMA_CACHE_TTL,
+)
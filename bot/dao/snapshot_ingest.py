@@ -0,0 +1,307 @@
+"""Инкрементальный приём снапшотов с абсолютными счётчиками.
+
+Внешний фид присылает раз в час по каждому видео только абсолютные
+значения views/likes/comments/reports. Приросты delta_* считаются здесь:
+последние известные счётчики каждого видео держатся в CounterIndex
+(словарь id -> номер строки плюс NumPy-массивы), который при старте
+заполняется из video_snapshots одним DISTINCT ON. Пачка сортируется по
+(видео, время) через lexsort, и все приросты считаются одним вычитанием:
+предыдущее значение берётся из соседней строки той же пачки или из индекса.
+
+Снапшоты не новее последнего известного для видео отбрасываются: иначе они
+сломали бы приросты уже записанных строк. Для видео, которых ещё нет в
+индексе, прирост первого снапшота равен самим счётчикам, как в videos.json.
+Сами видео должны уже быть в таблице videos: снапшоты ссылаются на неё.
+
+Запуск из каталога bot (файл — JSON Lines, по снапшоту в строке):
+    python -m dao.snapshot_ingest feed.jsonl --batch-size 200000
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence
+
+import asyncpg
+import numpy as np
+from loguru import logger
+
+from config import settings
+from dao.loader import SNAPSHOTS, _flush, _prepare_staging
+from dao.partitions import ensure_partitions
+from dao.rollup import refresh_daily_stats
+
+COUNTERS = ('views_count', 'likes_count', 'comments_count', 'reports_count')
+DEFAULT_BATCH_SIZE = 200_000
+
+SEED_SQL = f"""
+    SELECT DISTINCT ON (video_id) video_id, {', '.join(COUNTERS)}, created_at
+    FROM video_snapshots
+    ORDER BY video_id, created_at DESC
+"""
+
+UPDATE_VIDEOS_SQL = f"""
+    UPDATE videos AS v
+    SET {', '.join(f'{c} = u.{c}' for c in COUNTERS)}, updated_at = u.created_at
+    FROM unnest($1::text[], {', '.join(f'${i + 2}::bigint[]' for i in range(len(COUNTERS)))}, $6::timestamptz[])
+        AS u(id, {', '.join(COUNTERS)}, created_at)
+    WHERE v.id = u.id AND (v.updated_at IS NULL OR v.updated_at <= u.created_at)
+"""
+
+
+def _to_micros(values: Sequence[datetime]) -> np.ndarray:
+    return np.array([int(v.timestamp() * 1_000_000) for v in values], dtype=np.int64)
+
+
+class CounterIndex:
+    """Последние известные счётчики и время снапшота по каждому видео."""
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.positions: dict[str, int] = {}
+        self.counters = np.zeros((capacity, len(COUNTERS)), dtype=np.int64)
+        self.last_at = np.zeros(capacity, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def _grow(self, size: int) -> None:
+        capacity = len(self.last_at)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        counters = np.zeros((capacity, len(COUNTERS)), dtype=np.int64)
+        counters[:len(self.positions)] = self.counters[:len(self.positions)]
+        last_at = np.zeros(capacity, dtype=np.int64)
+        last_at[:len(self.positions)] = self.last_at[:len(self.positions)]
+        self.counters, self.last_at = counters, last_at
+
+    def lookup(self, video_ids: Sequence[str]) -> np.ndarray:
+        """Номера строк индекса; -1 для видео, которых в индексе нет."""
+        get = self.positions.get
+        return np.fromiter((get(v, -1) for v in video_ids), dtype=np.int64, count=len(video_ids))
+
+    def assign(self, video_ids: Sequence[str], counters: np.ndarray, last_at: np.ndarray) -> None:
+        positions = self.lookup(video_ids)
+        new = np.flatnonzero(positions < 0)
+        if len(new):
+            start = len(self.positions)
+            self._grow(start + len(new))
+            positions[new] = np.arange(start, start + len(new))
+            for offset, i in enumerate(new.tolist()):
+                self.positions[video_ids[i]] = start + offset
+        self.counters[positions] = counters
+        self.last_at[positions] = last_at
+
+    async def seed(self, conn: asyncpg.Connection, chunk_size: int = 100_000) -> None:
+        started = time.perf_counter()
+        ids: list[str] = []
+        rows: list[tuple] = []
+        times: list[datetime] = []
+
+        def flush() -> None:
+            if ids:
+                self.assign(ids, np.array(rows, dtype=np.int64), _to_micros(times))
+                ids.clear()
+                rows.clear()
+                times.clear()
+
+        async with conn.transaction(readonly=True):
+            async for record in conn.cursor(SEED_SQL, prefetch=10_000):
+                ids.append(record['video_id'])
+                rows.append(tuple(record[c] for c in COUNTERS))
+                times.append(record['created_at'])
+                if len(ids) >= chunk_size:
+                    flush()
+        flush()
+        logger.info('Индекс счётчиков заполнен: {} видео за {:.2f} c', len(self), time.perf_counter() - started)
+
+
+@dataclass
+class SnapshotBatch:
+    video_ids: list[str]
+    counters: np.ndarray
+    created_at: list[datetime]
+    ids: list[str | None]
+
+    def __len__(self) -> int:
+        return len(self.video_ids)
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> 'SnapshotBatch':
+        video_ids, counters, created_at, ids = [], [], [], []
+        for item in records:
+            video_ids.append(item['video_id'])
+            counters.append(tuple(int(item[c]) for c in COUNTERS))
+            value = item['created_at']
+            created_at.append(datetime.fromisoformat(value) if isinstance(value, str) else value)
+            ids.append(item.get('id'))
+        return cls(
+            video_ids=video_ids,
+            counters=np.array(counters, dtype=np.int64).reshape(-1, len(COUNTERS)),
+            created_at=created_at,
+            ids=ids,
+        )
+
+
+@dataclass
+class DeltaResult:
+    records: list[tuple]
+    video_ids: list[str]
+    last_counters: np.ndarray
+    last_at: np.ndarray
+    last_created_at: list[datetime]
+    days: set[date]
+    skipped: int
+
+
+MICROS_PER_DAY = 86_400 * 1_000_000
+EPOCH = date(1970, 1, 1)
+
+
+def _snapshot_id(video_id: str, micros: int) -> str:
+    """Детерминированный id для снапшотов без своего: повторная заливка не плодит дублей."""
+    return hashlib.md5(f'{video_id}|{micros}'.encode()).hexdigest()
+
+
+def compute_deltas(index: CounterIndex, batch: SnapshotBatch) -> DeltaResult:
+    """Считает delta_* для пачки; индекс не меняет (см. CounterIndex.assign)."""
+    n = len(batch)
+    if not n:
+        return DeltaResult([], [], np.empty((0, len(COUNTERS)), np.int64), np.empty(0, np.int64), [], set(), 0)
+
+    times = _to_micros(batch.created_at)
+    uniques, codes = np.unique(np.asarray(batch.video_ids, dtype=object), return_inverse=True)
+    order = np.lexsort((times, codes))
+    codes, times, counters = codes[order], times[order], batch.counters[order]
+
+    positions = index.lookup(uniques.tolist())[codes]
+    known = positions >= 0
+    index_at = np.where(known, index.last_at[np.maximum(positions, 0)], np.iinfo(np.int64).min)
+
+    # дубли по (видео, время) и снапшоты не новее индекса выкидываем
+    same_as_prev = np.zeros(n, dtype=bool)
+    same_as_prev[1:] = (codes[1:] == codes[:-1]) & (times[1:] == times[:-1])
+    keep = (times > index_at) & ~same_as_prev
+    skipped = int(n - keep.sum())
+    order, codes, times, counters, positions, known = (
+        order[keep], codes[keep], times[keep], counters[keep], positions[keep], known[keep],
+    )
+    if not len(order):
+        return DeltaResult([], [], np.empty((0, len(COUNTERS)), np.int64), np.empty(0, np.int64), [], set(), skipped)
+
+    first = np.ones(len(codes), dtype=bool)
+    first[1:] = codes[1:] != codes[:-1]
+    previous = np.empty_like(counters)
+    previous[1:] = counters[:-1]
+    from_index = first & known
+    previous[from_index] = index.counters[positions[from_index]]
+    previous[first & ~known] = 0
+    deltas = counters - previous
+
+    last = np.ones(len(codes), dtype=bool)
+    last[:-1] = codes[1:] != codes[:-1]
+
+    video_ids = uniques[codes].tolist()
+    created_at = [batch.created_at[i] for i in order.tolist()]
+    ids = [batch.ids[i] for i in order.tolist()]
+    counter_cols = counters.T.tolist()
+    delta_cols = deltas.T.tolist()
+
+    by_name = {'video_id': video_ids, 'created_at': created_at, 'updated_at': created_at}
+    for name, values in zip(COUNTERS, counter_cols):
+        by_name[name] = values
+    for name, values in zip(COUNTERS, delta_cols):
+        by_name[f'delta_{name}'] = values
+    by_name['id'] = [
+        snap_id or _snapshot_id(video_id, micros)
+        for snap_id, video_id, micros in zip(ids, video_ids, times.tolist())
+    ]
+    records = list(zip(*(by_name[c] for c in SNAPSHOTS.columns)))
+
+    last_rows = np.flatnonzero(last)
+    return DeltaResult(
+        records=records,
+        video_ids=[video_ids[i] for i in last_rows.tolist()],
+        last_counters=counters[last_rows],
+        last_at=times[last_rows],
+        last_created_at=[created_at[i] for i in last_rows.tolist()],
+        days={EPOCH + timedelta(days=d) for d in np.unique(times // MICROS_PER_DAY).tolist()},
+        skipped=skipped,
+    )
+
+
+class SnapshotIngestor:
+    def __init__(self, index: CounterIndex | None = None) -> None:
+        self.index = index or CounterIndex()
+        self._ready = False
+
+    async def start(self, conn: asyncpg.Connection) -> None:
+        await _prepare_staging(conn)
+        if not self._ready:
+            await self.index.seed(conn)
+            self._ready = True
+
+    async def ingest(self, conn: asyncpg.Connection, batch: SnapshotBatch) -> int:
+        """Пишет пачку в video_snapshots, обновляет счётчики videos и дневной срез."""
+        started = time.perf_counter()
+        result = compute_deltas(self.index, batch)
+        computed = time.perf_counter()
+
+        if result.records:
+            await ensure_partitions(conn, result.days)
+            async with conn.transaction():
+                await _flush(conn, [], result.records)
+                await conn.execute(
+                    UPDATE_VIDEOS_SQL,
+                    result.video_ids,
+                    *(col for col in result.last_counters.T.tolist()),
+                    result.last_created_at,
+                )
+                # срез в той же транзакции: версия данных не поднимется раньше него
+                await refresh_daily_stats(conn, result.days)
+            # индекс двигаем только после успешной записи
+            self.index.assign(result.video_ids, result.last_counters, result.last_at)
+
+        logger.info(
+            'Принято снапшотов: {} (пропущено {}), приросты за {:.3f} c, всего {:.2f} c',
+            len(result.records), result.skipped, computed - started, time.perf_counter() - started,
+        )
+        return len(result.records)
+
+
+def iter_batches(path: str | Path, batch_size: int) -> Iterator[SnapshotBatch]:
+    with open(path, encoding='utf-8') as f:
+        chunk: list[dict] = []
+        for line in f:
+            if line.strip():
+                chunk.append(json.loads(line))
+            if len(chunk) >= batch_size:
+                yield SnapshotBatch.from_records(chunk)
+                chunk = []
+        if chunk:
+            yield SnapshotBatch.from_records(chunk)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description='Приём снапшотов с абсолютными счётчиками')
+    parser.add_argument('path', type=Path, help='JSON Lines: video_id, счётчики, created_at')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(settings.PG_DSN)
+    try:
+        ingestor = SnapshotIngestor()
+        await ingestor.start(conn)
+        for batch in iter_batches(args.path, args.batch_size):
+            await ingestor.ingest(conn, batch)
+    finally:
+        await conn.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
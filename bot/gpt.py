@@ -1,105 +1,126 @@
+import argparse
 import asyncio
 import asyncpg
-import re
-from config import database_url
-from pydantic import BaseModel, Field, field_validator
-from openai import OpenAI
+import hashlib
+import time
+from loguru import logger
+from config import settings
+from dao.partitions import run_maintenance
+from dao.pool import acquire, init_pool, close_pool, pool_stats
+from dao.schema_cache import schema_cache
+from pipeline.export import QueryResult, collect, render_rows
+from pipeline.coalesce import single_flight
+from pipeline.columnar import columnar, run_refresh
+from pipeline.guard import explain, fetch_guarded
+from pipeline.hedge import hedge_delay, race, record_latency
+from pipeline.json_stream import JsonObjectScanner
+from pipeline.llm import complete, stream
+from pipeline.prompt import prompt_builder
+from pipeline.metrics import register_gauges, set_path, stage, start_metrics_server, stop_metrics_server, trace
+from pipeline.result_cache import result_cache
+from pipeline.sql_cache import make_key, sql_cache
+from pipeline.sql_parse import canonicalize
+from pipeline.templates import run_template
+from user.schemas import DateRange, DBQuestion, parse_intent
+from pydantic import BaseModel, Field, model_validator
 import json
-import os
+from contextlib import aclosing
+from dataclasses import dataclass, field, replace
 from pathlib import Path
-from dotenv import load_dotenv
-from openai import OpenAI
-from pydantic import BaseModel, Field, field_validator
+from typing import Any, Awaitable, Callable
 
-from config import database_url
-
-
-def to_asyncpg_dsn(url: str)->str:
-    return url.replace('postgresql+asyncpg://', 'postgresql://',1)
-
-FORBIDDEN = re.compile(r"\b(drop|delete|update|insert|alter|truncate|create|grant|revoke|copy)\b", re.IGNORECASE)
-
-
-AGG = re.compile(r"\b(count|sum|avg|min|max)\s*\(", re.IGNORECASE)
 
 class RunSQLInput(BaseModel):
-    sql: str = Field(..., min_length=1, max_length=5000)
+    sql: str = Field(..., min_length=1)
+    params: tuple[Any, ...] = ()
 
-    @field_validator("sql")
+    @model_validator(mode="before")
     @classmethod
-    def validate_and_normalize_sql(cls, v: str) -> str:
-        s = v.strip()
-        low = s.lower()
-
-        if ";" in s:
-            raise ValueError("Никаких ';'.")
-
-        if not (low.startswith("select") or low.startswith("with")):
-            raise ValueError("Разрешены только SELECT (включая WITH).")
-
-        if FORBIDDEN.search(s):
-            raise ValueError("Запрещены опасные команды SQL")
-
-        if re.search(r"\blimit\b", s, re.IGNORECASE) is None:
-            if not AGG.search(s):
-                s += " LIMIT 50"
-
-        return s
-
-
-async def run_sql(sql: str):
-    dsn = to_asyncpg_dsn(database_url)
-    safe_sql = RunSQLInput(sql=sql).sql
+    def validate_and_normalize_sql(cls, data: Any) -> Any:
+        if isinstance(data, dict) and isinstance(data.get("sql"), str) and "params" not in data:
+            if len(data["sql"]) > 5000:
+                raise ValueError("Слишком длинный SQL")
+            canonical = canonicalize(data["sql"])
+            return {"sql": canonical.sql, "params": canonical.params}
+        return data
+
+
+# этап ответа для сообщения о ходе работы: 'sql', 'db', 'format'
+StatusCallback = Callable[[str], Awaitable[None]]
+_status_listeners: dict[tuple, list[StatusCallback]] = {}
+
+
+@dataclass
+class DBAnswer:
+    text: str
+    sql: str | None = None
+    document: Path | None = None
+    total_rows: int = 0
+    trace_id: str | None = None
+    timings: dict[str, float] = field(default_factory=dict)
+
+
+async def run_sql(sql: str) -> QueryResult:
+    with stage('validate'):
+        checked = RunSQLInput(sql=sql)
+    cache_key = f"{checked.sql} -- {checked.params!r}"
+    with stage('result_cache'):
+        watermark = await result_cache.watermark()
+        cached = result_cache.get(cache_key, watermark)
+    if cached is not None:
+        return QueryResult(rows=cached, total_rows=len(cached))
     
-    conn = await asyncpg.connect(dsn=dsn)
-    try:
-        rows = await conn.fetch(safe_sql)
-        
-        return [dict(r) for r in rows]
-    finally:
-        await conn.close()
+    with stage('db'):
+        async with acquire() as conn:
+            result = await fetch_guarded(conn, checked.sql, *checked.params)
+    
+    if result.path is None:
+        result_cache.put(cache_key, watermark, result.rows)
+    return result
 
 async def get_schema_text()->str:
-    dsn = to_asyncpg_dsn(database_url)
-    conn = await asyncpg.connect(dsn)
-    try:
-        rows = await conn.fetch(
-            """
-            SELECT table_name, column_name, data_type
-            FROM information_schema.columns
-            WHERE table_schema = 'public'
-            ORDER BY table_name, ordinal_position;
-            """
-        )
-    finally:
-        await conn.close()
-    
-    tables = {}
-    
-    for r in rows:
-        tables.setdefault(r["table_name"], []).append(f"{r['column_name']} {r['data_type']}"
-        )
-    lines = []
-    for t, cols in tables.items():
-        lines.append(f'TABLE{t}: ' + ', '.join(cols))
-    return '\n'.join(lines)
+    return await schema_cache.get_text()
 
-def llm_make_sql(client: OpenAI, question: str, schema_text: str) -> str:
-    system = (
+SYSTEM_PROMPT = (
     "Ты помощник, который переводит вопрос пользователя в SQL для PostgreSQL.\n"
-    "У тебя есть схема базы данных.\n"
+    "У тебя есть схема базы данных: только таблицы и столбцы, нужные для вопроса. "
+    "[a..b] — примерный диапазон значений столбца, напр. — пример значения.\n"
     "Правила:\n"
     "- Разрешён только SELECT.\n"
     "- Никаких ';'.\n"
     "- Если считаешь количество — используй COUNT(*) и дай имя столбца cnt.\n"
-    "- ВАЖНО: поля *_count часто хранятся как текст. Для сравнений и сумм всегда используй CAST(... AS INTEGER).\n"
-    "- ВАЖНО: для фильтра по дате используй DATE(created_at) = 'YYYY-MM-DD' (или BETWEEN для диапазона).\n"
+    "- Поля *_count имеют тип bigint, даты — timestamptz (UTC). Не используй CAST для этих полей.\n"
+    "- ВАЖНО: фильтруй по дате полуинтервалом без функций над столбцом, чтобы работали индексы: "
+    "created_at >= 'YYYY-MM-DD' AND created_at < 'YYYY-MM-DD' (следующий день после конца диапазона). "
+    "Не используй DATE(created_at).\n"
     "- Верни СТРОГО JSON без лишнего текста: {\"sql\": \"...\"}\n"
-    "Если вопрос про на сколько выросли просмотры за дату D:"
-    "- считай delta = last_views(D) - last_views(D-1) по каждому video_id"
-    "- last_views(day) = views_count из последнего snapshot в этот день (по created_at)"
-    "- views_count всегда CAST(... AS INTEGER)"
-    )
+    "Если вопрос про на сколько выросли просмотры (лайки, комментарии, жалобы) за дату D или период:\n"
+    "- используй таблицу video_daily_stats: одна строка на видео и день (day, UTC), "
+    "*_count — значения из последнего snapshot за день, delta_*_count — прирост к предыдущему дню;\n"
+    "- прирост за период = SUM(delta_views_count) WHERE day BETWEEN 'D1' AND 'D2';\n"
+    "- не пересчитывай это оконными функциями по video_snapshots.\n"
+)
+
+# Меняется вместе с промптом или моделью и сбрасывает кэш SQL
+PROMPT_VERSION = hashlib.sha256(f"{settings.LLM_MODEL}\n{SYSTEM_PROMPT}".encode()).hexdigest()[:16]
+
+
+class SQLCandidateError(Exception):
+    """SQL от модели не прошёл EXPLAIN или упал при выполнении."""
+
+    def __init__(self, sql: str, error: Exception) -> None:
+        super().__init__(str(error))
+        self.sql = sql
+        self.error = error
+
+
+async def llm_make_sql(
+    question: str,
+    schema_text: str,
+    user_id: int | None = None,
+    model: str | None = None,
+    failed: SQLCandidateError | None = None,
+) -> str:
     user = (
         "Схема БД:\n"
         f"{schema_text}\n\n"
@@ -107,17 +128,85 @@ def llm_make_sql(client: OpenAI, question: str, schema_text: str) -> str:
         f"{question}\n"
     )
     
-    resp = client.chat.completions.create(
-        model = 'deepseek/deepseek-v3.2',
-        messages=[
-            {'role': "system", "content": system},
-            {"role": "user", "content": user},
+    messages = [
+        {'role': "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user},
+    ]
+    if failed is not None:
+        messages += [
+            {"role": "assistant", "content": json.dumps({"sql": failed.sql}, ensure_ascii=False)},
+            {
+                "role": "user",
+                "content": (
+                    f"Этот запрос завершился ошибкой PostgreSQL: {failed}\n"
+                    "Исправь запрос и верни СТРОГО JSON: {\"sql\": \"...\"}"
+                ),
+            },
         ]
-    )
-    
-    content = resp.choices[0].message.content
-    
-    return content
+    if not settings.LLM_STREAM:
+        resp = await complete(messages, user_id=user_id, model=model)
+        return resp.choices[0].message.content
+
+    # как только {"sql": ...} закрылся, хвост ответа не ждём
+    scanner = JsonObjectScanner()
+    async with aclosing(stream(messages, user_id=user_id, model=model)) as chunks:
+        async for chunk in chunks:
+            obj = scanner.feed(chunk)
+            if obj is not None:
+                return obj
+    return scanner.text
+
+
+async def _sql_candidate(
+    question: str,
+    schema_text: str,
+    user_id: int | None,
+    model: str,
+    failed: SQLCandidateError | None,
+) -> str:
+    started = time.perf_counter()
+    try:
+        raw = await llm_make_sql(question, schema_text, user_id=user_id, model=model, failed=failed)
+    except asyncio.CancelledError:
+        # отменённая модель отвечала бы дольше elapsed; без этого замера медленные
+        # ответы не попадают в окно и порог подстраховки со временем сползает вниз
+        elapsed = time.perf_counter() - started
+        if elapsed >= hedge_delay(model):
+            record_latency(model, elapsed)
+        raise
+    record_latency(model, time.perf_counter() - started)
+    sql = extract_from_sql(raw)
+    checked = RunSQLInput(sql=sql)
+    try:
+        async with acquire() as conn:
+            async with conn.transaction(readonly=True):
+                await explain(conn, checked.sql, *checked.params)
+    except asyncpg.PostgresError as e:
+        raise SQLCandidateError(sql, e) from e
+    return sql
+
+
+async def generate_sql(
+    question: str,
+    schema_text: str,
+    user_id: int | None = None,
+    failed: SQLCandidateError | None = None,
+) -> str:
+    """SQL от основной модели, подстрахованный моделями из LLM_HEDGE_MODELS.
+
+    Принимается первый кандидат, который прошёл RunSQLInput и EXPLAIN.
+    """
+    models = [settings.LLM_MODEL, *settings.LLM_HEDGE_MODELS]
+    # очередь пользователя пропускает один запрос за раз, поэтому она только у основной модели
+    model, sql = await race([
+        (name, lambda name=name, uid=user_id if i == 0 else None: _sql_candidate(
+            question, schema_text, uid, name, failed,
+        ))
+        for i, name in enumerate(models)
+    ])
+    if model != settings.LLM_MODEL:
+        logger.info('SQL взят у подстраховочной модели {}', model)
+    return sql
 
 def extract_from_sql(text: str) -> str:
     if not text or not text.strip():
@@ -143,20 +232,6 @@ def extract_from_sql(text: str) -> str:
 
     return obj["sql"]
 
-def _load_env() -> None:
-    base_dir = Path(__file__).parent.parent
-    env_path = base_dir / ".env"
-    load_dotenv(env_path)
-    
-def _build_client() -> OpenAI:
-    _load_env()
-
-    api_key = os.getenv("GPT_CREDENTIALS")
-    if not api_key:
-        raise RuntimeError("Не найден ключ GPT_CREDENTIALS в .env")
-    return OpenAI(api_key=api_key, base_url="https://openrouter.ai/api/v1")
-
-
 def _merge_question(question: str, extra_context: str | None = None) -> str:
     
     if extra_context:
@@ -165,29 +240,289 @@ def _merge_question(question: str, extra_context: str | None = None) -> str:
     return question
 
 
-async def ask_with_db(question: str, extra_context: str | None = None) -> str:
-    client = _build_client()
-    merged_question = _merge_question(question, extra_context)
-    
-    schema_text = await get_schema_text()
-    raw = llm_make_sql(client, merged_question, schema_text)
-    sql = extract_from_sql(raw)
-    rows = await run_sql(sql)
+def _date_context(date_range: DateRange) -> str:
+    return (
+        f"Диапазон дат: {date_range.start_date} - "
+        f"{date_range.end_date} (включительно)."
+    )
 
-    if rows and len(rows) == 1 and isinstance(rows[0], dict) and len(rows[0]) == 1:
-        only_value = next(iter(rows[0].values()))
-        if only_value is None:
-            return "0"
-        return str(only_value)
 
-    return json.dumps(rows, ensure_ascii=False, indent=2)
-    
-async def main():
-    q = "Сколько видео набрало больше 100 000 просмотров за всё время?"
-    answer = await ask_with_db(q)
-    print("\n=== FINAL ANSWER ===")
-    print(answer)
+_background: list[asyncio.Task] = []
+
+
+async def init_pipeline() -> None:
+    await init_pool()
+    await sql_cache.init(PROMPT_VERSION)
+    await result_cache.init()
+    register_gauges('db_pool', pool_stats)
+    register_gauges('sql_cache', sql_cache.stats)
+    register_gauges('result_cache', result_cache.stats)
+    register_gauges('single_flight', single_flight.stats)
+    await start_metrics_server()
+    if settings.PARTITION_MAINTENANCE_INTERVAL > 0:
+        _background.append(asyncio.create_task(run_maintenance(settings.PARTITION_MAINTENANCE_INTERVAL)))
+    if settings.COLUMNAR_ENABLED:
+        columnar.open()
+        register_gauges('columnar', columnar.stats)
+        _background.append(asyncio.create_task(run_refresh(columnar, settings.COLUMNAR_REFRESH_INTERVAL)))
+
+
+async def close_pipeline() -> None:
+    for task in _background:
+        task.cancel()
+    _background.clear()
+    logger.info('Статистика кэша SQL: {}', sql_cache.stats())
+    logger.info('Статистика кэша результатов: {}', result_cache.stats())
+    await stop_metrics_server()
+    await close_pool()
+
+
+async def ask_with_db(
+    question: str,
+    extra_context: str | None = None,
+    user_id: int | None = None,
+    date_range: DateRange | None = None,
+    on_status: StatusCallback | None = None,
+) -> DBAnswer:
+    async with trace(user_id=user_id) as current:
+        answer = await _answer(question, extra_context, user_id, date_range, on_status)
+    answer.trace_id = current.id
+    answer.timings = dict(current.stages)
+    return answer
+
+
+async def ask_coalesced(
+    question: str,
+    user_id: int | None = None,
+    date_range: DateRange | None = None,
+    on_status: StatusCallback | None = None,
+) -> DBAnswer:
+    """ask_with_db, но одинаковые одновременные вопросы считаются один раз.
+
+    Статусы общего вычисления получают все, кто его ждёт.
+    """
+    key = (question, date_range.start_date, date_range.end_date) if date_range else (question,)
+    listeners = _status_listeners.setdefault(key, [])
+    if on_status is not None:
+        listeners.append(on_status)
+
+    async def broadcast(status: str) -> None:
+        for callback in list(listeners):
+            await callback(status)
+
+    try:
+        answer, joined = await single_flight.run(
+            key, lambda: ask_with_db(question, user_id=user_id, date_range=date_range, on_status=broadcast),
+        )
+    finally:
+        if on_status is not None:
+            listeners.remove(on_status)
+        if not listeners and _status_listeners.get(key) is listeners:
+            del _status_listeners[key]
+    if joined:
+        logger.info('Вопрос склеен с уже идущим ({}): {}', answer.trace_id, question)
+        answer = replace(answer, timings=dict(answer.timings))
+    return answer
+
+
+async def _answer(
+    question: str,
+    extra_context: str | None,
+    user_id: int | None,
+    date_range: DateRange | None,
+    on_status: StatusCallback | None = None,
+) -> DBAnswer:
+    async def status(name: str) -> None:
+        if on_status is not None:
+            await on_status(name)
+
+    intent = parse_intent(question, date_range) if extra_context is None else None
+    if intent is not None and settings.COLUMNAR_ENABLED:
+        with stage('columnar'):
+            rows = columnar.answer(intent, await result_cache.watermark())
+        if rows is not None:
+            set_path('columnar')
+            logger.info('Вопрос закрыт колоночным движком: {}', intent.name)
+            return _build_answer(None, collect(rows))
+
+    if intent is not None:
+        set_path('template')
+        await status('db')
+        with stage('template'):
+            sql, result = await run_template(intent)
+        logger.info('Вопрос закрыт шаблоном {}', intent.name)
+        return _build_answer(sql, result)
+
+    cache_key = make_key(question, date_range, extra_context)
+    if date_range and not extra_context:
+        extra_context = _date_context(date_range)
+
+    with stage('sql_cache'):
+        sql = await sql_cache.get(cache_key)
+    if sql is not None:
+        set_path('cache')
+        await status('db')
+        try:
+            result = await run_sql(sql)
+        except Exception:
+            await sql_cache.discard(cache_key)
+            raise
+    else:
+        set_path('llm')
+        merged_question = _merge_question(question, extra_context)
+
+        with stage('schema'):
+            schema_text = await prompt_builder.schema_for(merged_question)
+        failed = None
+        for attempt in range(settings.LLM_REPAIR_ATTEMPTS + 1):
+            await status('sql')
+            try:
+                with stage('llm' if failed is None else 'repair'):
+                    sql = await generate_sql(merged_question, schema_text, user_id=user_id, failed=failed)
+                await status('db')
+                try:
+                    result = await run_sql(sql)
+                except asyncpg.PostgresError as e:
+                    raise SQLCandidateError(sql, e) from e
+                break
+            except SQLCandidateError as e:
+                if attempt == settings.LLM_REPAIR_ATTEMPTS:
+                    raise e.error from e
+                logger.warning('SQL от модели упал в БД ({}), просим исправить: {}', e, e.sql)
+                failed = e
+        await sql_cache.put(cache_key, question, sql)
+
+    await status('format')
+    return _build_answer(sql, result)
+
+
+def _build_answer(sql: str | None, result: QueryResult) -> DBAnswer:
+    if result.path is None:
+        return DBAnswer(text=render_rows(result.rows), sql=sql, total_rows=result.total_rows)
+
+    text = (
+        f"Строк в результате: {result.total_rows}"
+        f"{' (достигнут лимит выгрузки)' if result.truncated else ''}. "
+        f"Полный результат — в файле, первые {len(result.rows)}:\n"
+        f"{render_rows(result.rows)}"
+    )
+    return DBAnswer(text=text, sql=sql, document=result.path, total_rows=result.total_rows)
+
+
+def _read_batch(path: Path, done: set[str]) -> list[tuple[str, str]]:
+    """(id, вопрос) из JSONL; id — поле id / request_id или номер строки."""
+    pending = []
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {'question': item}
+            qid = str(item.get('id') or item.get('request_id') or number)
+            if qid not in done:
+                pending.append((qid, item.get('question') or item.get('text') or ''))
+    return pending
+
+
+def _read_done(path: Path, retry_errors: bool) -> set[str]:
+    done: set[str] = set()
+    if not path.exists():
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # строка, оборванная при прерывании прогона
+                continue
+            if not (retry_errors and record.get('error')):
+                done.add(record['id'])
+    return done
+
+
+async def _answer_record(qid: str, question: str) -> dict:
+    record: dict[str, Any] = {'id': qid, 'question': question}
+    started = time.perf_counter()
+    try:
+        parsed = DBQuestion(question=question)
+        answer = await ask_coalesced(parsed.normalized_question, date_range=parsed.date_range)
+    except Exception as e:
+        record['error'] = f'{type(e).__name__}: {e}'
+    else:
+        record.update(
+            answer=answer.text,
+            sql=answer.sql,
+            total_rows=answer.total_rows,
+            document=str(answer.document) if answer.document else None,
+            trace_id=answer.trace_id,
+            timings={name: round(seconds, 6) for name, seconds in answer.timings.items()},
+        )
+    record['seconds'] = round(time.perf_counter() - started, 6)
+    return record
+
+
+async def run_batch(
+    input_path: Path,
+    output_path: Path,
+    concurrency: int,
+    retry_errors: bool = False,
+) -> dict:
+    """Прогоняет вопросы из JSONL через ask_with_db и дописывает ответы в output_path.
+
+    Уже отвеченные id пропускаются, поэтому прерванный прогон можно просто
+    запустить снова.
+    """
+    done = _read_done(output_path, retry_errors)
+    pending = _read_batch(input_path, done)
+    logger.info('Вопросов к прогону: {}, уже отвечено: {}, параллельно: {}', len(pending), len(done), concurrency)
+
+    queue: asyncio.Queue[tuple[str, str]] = asyncio.Queue()
+    for item in pending:
+        queue.put_nowait(item)
+    stats = {'answered': 0, 'errors': 0}
+    started = time.perf_counter()
+
+    with open(output_path, 'a', encoding='utf-8') as out:
+        if out.tell() and not output_path.read_bytes().endswith(b'\n'):
+            out.write('\n')
+
+        async def worker() -> None:
+            while not queue.empty():
+                record = await _answer_record(*queue.get_nowait())
+                out.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+                out.flush()
+                stats['errors' if 'error' in record else 'answered'] += 1
+                finished = stats['answered'] + stats['errors']
+                if finished % 100 == 0:
+                    logger.info(
+                        'Прогон: {}/{}, ошибок {}, {:.1f} вопр/с',
+                        finished, len(pending), stats['errors'], finished / (time.perf_counter() - started),
+                    )
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    logger.info('Прогон завершён: {}', stats)
+    return stats
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description='Пакетный прогон вопросов через ask_with_db')
+    parser.add_argument('input', type=Path, help='JSON Lines: {"id": ..., "question": ...}')
+    parser.add_argument('-o', '--output', type=Path, default=None,
+                        help='куда дописывать ответы (по умолчанию <input>.answers.jsonl)')
+    parser.add_argument('-c', '--concurrency', type=int, default=16, help='вопросов одновременно')
+    parser.add_argument('--retry-errors', action='store_true', help='повторить вопросы, которые упали')
+    args = parser.parse_args()
+
+    output = args.output or args.input.with_suffix('.answers.jsonl')
+    await init_pipeline()
+    try:
+        await run_batch(args.input, output, args.concurrency, args.retry_errors)
+    finally:
+        await close_pipeline()
+
 
 if __name__ == '__main__':
     asyncio.run(main())
-
@@ -3,7 +3,11 @@ from aiogram.types import BotCommand, BotCommandScopeDefault
 from loguru import logger
 from user.user_router import user_router
 from config import bot, dp
-from dao.database_middleware import DatabaseMiddlewareWithCommit, DatabaseMiddlewareWithoutCommit
+from dao.database_middleware import DatabaseMiddleware
+from user.middlewares import ThrottlingMiddleware
+from gpt import init_pipeline, close_pipeline
+from server import drain_updates, in_flight, run_webhook
+from config import settings
 import sys
 from pathlib import Path
 import os
@@ -33,22 +37,34 @@ async def stop_bot():
     
     
 
-async def main():
-    dp.update.middleware.register(DatabaseMiddlewareWithCommit())
-    dp.update.middleware.register(DatabaseMiddlewareWithoutCommit())
+def setup_dispatcher():
+    dp.update.outer_middleware.register(in_flight)
+    dp.message.middleware.register(DatabaseMiddleware())
+    dp.callback_query.middleware.register(DatabaseMiddleware())
+    dp.message.middleware.register(ThrottlingMiddleware())
     dp.include_router(user_router)
+    dp.startup.register(init_pipeline)
     dp.startup.register(start_bot)
+    # сначала дожидаемся начатых вопросов, потом закрываем пул
+    dp.shutdown.register(drain_updates)
     dp.shutdown.register(stop_bot)
+    dp.shutdown.register(close_pipeline)
+
+async def main():
+    setup_dispatcher()
     
     try:
-        await bot.delete_webhook(drop_pending_updates=True)
+        await bot.delete_webhook(drop_pending_updates=settings.DROP_PENDING_UPDATES)
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
         await bot.session.close()
 
 if __name__=='__main__':
     try:
-        asyncio.run(main())
+        if settings.BOT_MODE == 'webhook':
+            run_webhook(setup_dispatcher)
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info('Принудительное завршение работы через конструкцию Ctrl + C')
     finally:
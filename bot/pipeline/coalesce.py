@@ -0,0 +1,47 @@
+"""Склейка одинаковых вычислений, которые идут одновременно.
+
+Пока вычисление с тем же ключом ещё не закончилось, новые вызовы не
+запускают своё, а ждут результат первого. Вычисление идёт в отдельной
+задаче, поэтому отмена одного из ждущих не обрывает ответ остальным.
+Склейка работает в пределах одного процесса: в webhook-режиме у каждого
+воркера своя.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from pipeline.metrics import set_path, stage
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.joined = 0
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # ошибку уже получили ждущие; читаем её, чтобы asyncio не ругался
+            task.exception()
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """Возвращает (результат, joined): joined=True, если ждали чужое вычисление."""
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.create_task(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+            return await asyncio.shield(task), False
+
+        self.joined += 1
+        set_path('coalesced')
+        with stage('coalesce'):
+            return await asyncio.shield(task), True
+
+    def stats(self) -> dict:
+        return {'inflight': len(self._inflight), 'leaders': self.leaders, 'joined': self.joined}
+
+
+single_flight = SingleFlight()
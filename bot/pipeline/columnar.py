@@ -0,0 +1,539 @@
+"""Колоночный движок для типовых агрегатов без похода в Postgres.
+
+videos и video_snapshots хранятся как NumPy-массивы в файлах .npy в
+COLUMNAR_DIR и открываются через mmap, поэтому воркеры бота делят одни и те
+же страницы памяти. Идентификаторы видео и креаторов закодированы словарями
+(строка -> номер), время — микросекунды от эпохи UTC, пустой счётчик —
+NULL_VALUE.
+
+Под каждый шаблон из pipeline.templates заранее построена структура, на
+которой ответ — пара бинарных поисков:
+- count_videos_above: отсортированные значения каждого счётчика;
+- top_videos: порядок видео по счётчику;
+- growth: снапшоты сегмента отсортированы по времени, рядом — накопленные
+  суммы приростов (тот же результат, что SUM по video_daily_stats);
+- creator_videos: даты публикации, сгруппированные по креатору.
+
+Снапшоты лежат неизменяемыми сегментами из целых суток (UTC). В манифесте
+для каждых суток хранится отпечаток: число снапшотов и суммы приростов.
+Обновление сравнивает отпечатки с БД и заново загружает все сутки, которые
+изменились: дозагрузка, upsert, снапшоты задним числом. Эти сутки пишутся
+новым сегментом, а в старых помечаются устаревшими (stale) и в growth
+вычитаются. Видео перезаписываются целиком. Когда сегментов больше
+COLUMNAR_MAX_SEGMENTS, они сливаются в один без устаревших строк. Состав
+файлов описывает manifest.json, который заменяется атомарно; пишет один
+воркер (flock), остальные перечитывают манифест, когда он сменился.
+
+answer() отвечает, только если данные собраны при текущей версии
+bot_service.data_version, иначе вопрос уходит в SQL.
+
+Запуск из каталога bot:
+    python -m pipeline.columnar build                 # из БД
+    python -m pipeline.columnar build ../videos.json
+    python -m pipeline.columnar refresh
+"""
+import argparse
+import asyncio
+import fcntl
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator
+
+import asyncpg
+import numpy as np
+from loguru import logger
+
+from config import settings
+from dao.loader import iter_videos
+from dao.pool import acquire
+from user.schemas import Intent
+
+COUNTERS = ('views_count', 'likes_count', 'comments_count', 'reports_count')
+NULL_VALUE = int(np.iinfo(np.int64).min)
+MANIFEST = 'manifest.json'
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+DAY = 86_400_000_000
+
+VIDEOS_SQL = f"""
+    SELECT id, creator_id, video_created_at, {', '.join(COUNTERS)}
+    FROM videos
+"""
+SNAPSHOTS_SQL = f"""
+    SELECT video_id, created_at, {', '.join(f'delta_{c}' for c in COUNTERS)}
+    FROM video_snapshots
+"""
+# отпечаток суток: число снапшотов и суммы приростов — этого достаточно для growth
+DAYS_SQL = f"""
+    SELECT floor(extract(epoch FROM created_at) / 86400)::int AS day, count(*) AS rows,
+           {', '.join(f'COALESCE(sum(delta_{c}), 0)::bigint AS delta_{c}' for c in COUNTERS)}
+    FROM video_snapshots
+    GROUP BY 1
+"""
+
+
+def _micros(value: datetime | None) -> int:
+    if value is None:
+        return NULL_VALUE
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _day_micros(day: date) -> int:
+    return _micros(datetime(day.year, day.month, day.day, tzinfo=timezone.utc))
+
+
+def _fingerprint(created_at: np.ndarray, deltas: np.ndarray) -> dict[str, list[int]]:
+    days = created_at // DAY
+    unique, inverse, counts = np.unique(days, return_inverse=True, return_counts=True)
+    sums = np.zeros((len(unique), len(COUNTERS)), dtype=np.int64)
+    np.add.at(sums, inverse, deltas)
+    return {str(d): [int(n), *map(int, s)] for d, n, s in zip(unique.tolist(), counts.tolist(), sums)}
+
+
+def _day_ranges(days: set[int]) -> list[tuple[int, int]]:
+    """Сутки -> отрезки подряд идущих суток [от, до)."""
+    ranges: list[tuple[int, int]] = []
+    for day in sorted(days):
+        if ranges and ranges[-1][1] == day:
+            ranges[-1] = (ranges[-1][0], day + 1)
+        else:
+            ranges.append((day, day + 1))
+    return ranges
+
+
+def _count(value) -> int:
+    return NULL_VALUE if value is None else int(value)
+
+
+class _VideoRows:
+    """Видео для записи; номера уже известных видео сохраняются, новые дописываются в конец."""
+
+    def __init__(self, ids: list[str]) -> None:
+        self.ids = list(ids)
+        self.codes = {video_id: i for i, video_id in enumerate(self.ids)}
+        self.creators: list[str | None] = [None] * len(self.ids)
+        self.created_at = [NULL_VALUE] * len(self.ids)
+        self.counters = [(NULL_VALUE,) * len(COUNTERS)] * len(self.ids)
+
+    def code(self, video_id: str) -> int:
+        code = self.codes.get(video_id)
+        if code is None:
+            code = self.codes[video_id] = len(self.ids)
+            self.ids.append(video_id)
+            self.creators.append(None)
+            self.created_at.append(NULL_VALUE)
+            self.counters.append((NULL_VALUE,) * len(COUNTERS))
+        return code
+
+    def add(self, video_id: str, creator_id: str | None, created_at: int, counters: tuple[int, ...]) -> None:
+        code = self.code(video_id)
+        self.creators[code] = creator_id
+        self.created_at[code] = created_at
+        self.counters[code] = counters
+
+
+class _SnapshotRows:
+    def __init__(self) -> None:
+        self.video: list[int] = []
+        self.created_at: list[int] = []
+        self.deltas: list[tuple[int, ...]] = []
+
+    def __len__(self) -> int:
+        return len(self.video)
+
+    def add(self, video: int, created_at: int, deltas: tuple[int, ...]) -> None:
+        self.video.append(video)
+        self.created_at.append(created_at)
+        self.deltas.append(deltas)
+
+
+def _save(directory: Path, name: str, array: np.ndarray) -> None:
+    np.save(directory / f'{name}.npy', array, allow_pickle=False)
+
+
+def _load_dir(directory: Path) -> dict[str, np.ndarray]:
+    if not directory.is_dir():
+        raise FileNotFoundError(directory)
+    return {p.stem: np.load(p, mmap_mode='r') for p in directory.glob('*.npy')}
+
+
+def _write_videos(directory: Path, rows: _VideoRows) -> None:
+    directory.mkdir(parents=True)
+    created_at = np.array(rows.created_at, dtype=np.int64)
+    counters = np.array(rows.counters, dtype=np.int64).reshape(-1, len(COUNTERS))
+
+    names = sorted({c for c in rows.creators if c is not None})
+    codes = {name: i for i, name in enumerate(names)}
+    creator = np.fromiter((codes.get(c, -1) for c in rows.creators), dtype=np.int32, count=len(rows.creators))
+    # даты публикации по креаторам: креатор i — отрезок offsets[i]:offsets[i + 1]
+    order = np.lexsort((created_at, creator))
+    order = order[creator[order] >= 0]
+    offsets = np.searchsorted(creator[order], np.arange(len(names) + 1)).astype(np.int64)
+
+    _save(directory, 'id', np.array(rows.ids, dtype=str))
+    _save(directory, 'creator', creator)
+    _save(directory, 'creators', np.array(names, dtype=str))
+    _save(directory, 'creator_offsets', offsets)
+    _save(directory, 'creator_created_at', created_at[order])
+    for i, name in enumerate(COUNTERS):
+        values = counters[:, i]
+        rank = np.argsort(values, kind='stable')
+        rank = rank[values[rank] != NULL_VALUE]
+        _save(directory, name, values)
+        _save(directory, f'{name}_rank', rank.astype(np.int32))
+        _save(directory, f'{name}_sorted', values[rank])
+
+
+def _write_segment(directory: Path, video: np.ndarray, created_at: np.ndarray, deltas: np.ndarray) -> None:
+    directory.mkdir(parents=True)
+    order = np.argsort(created_at, kind='stable')
+    _save(directory, 'video', video[order].astype(np.int32))
+    _save(directory, 'created_at', created_at[order])
+    for i, name in enumerate(COUNTERS):
+        cumulative = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(deltas[order, i], out=cumulative[1:])
+        _save(directory, f'delta_{name}_cum', cumulative)
+
+
+class ColumnarEngine:
+    def __init__(self, directory: Path, max_segments: int) -> None:
+        self.directory = Path(directory)
+        self.max_segments = max_segments
+        self.manifest: dict | None = None
+        self.videos: dict[str, np.ndarray] = {}
+        self.segments: list[dict[str, np.ndarray]] = []
+        self._stamp: tuple[int, int] | None = None
+        self.queries = 0
+        self.refreshes = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.manifest is not None
+
+    def open(self) -> bool:
+        self.sync()
+        return self.ready
+
+    def sync(self) -> None:
+        """Перечитывает манифест, если его заменил другой процесс."""
+        try:
+            st = os.stat(self.directory / MANIFEST)
+        except FileNotFoundError:
+            return
+        if (st.st_ino, st.st_mtime_ns) == self._stamp:
+            return
+        for _ in range(3):
+            try:
+                manifest = json.loads((self.directory / MANIFEST).read_text(encoding='utf-8'))
+                videos = _load_dir(self.directory / manifest['videos'])
+                segments = [_load_dir(self.directory / s['dir']) for s in manifest['segments']]
+            except FileNotFoundError:
+                # манифест сменился, пока читали файлы, — читаем новый
+                continue
+            self.manifest, self.videos, self.segments = manifest, videos, segments
+            self._stamp = (st.st_ino, st.st_mtime_ns)
+            logger.info(
+                'Колоночные данные открыты: поколение {}, видео {}, снапшотов {} в {} сегм.',
+                manifest['generation'], manifest['video_rows'],
+                sum(s['rows'] for s in manifest['segments']), len(segments),
+            )
+            return
+        logger.warning('Не удалось открыть колоночные данные в {}', self.directory)
+
+    # --- запросы ---
+
+    def count_videos(self, metric: str, op: str, threshold: int) -> int:
+        values = self.videos[f'{metric}_sorted']
+        if op == '>':
+            return int(len(values) - np.searchsorted(values, threshold, side='right'))
+        if op == '<':
+            return int(np.searchsorted(values, threshold, side='left'))
+        raise ValueError(f'Неподдерживаемый оператор {op}')
+
+    def top_videos(self, metric: str, limit: int) -> list[dict]:
+        rank = self.videos[f'{metric}_rank'][::-1][:limit]
+        ids, creator, names = self.videos['id'], self.videos['creator'], self.videos['creators']
+        values = self.videos[metric]
+        return [
+            {
+                'id': str(ids[i]),
+                'creator_id': str(names[creator[i]]) if creator[i] >= 0 else None,
+                metric: int(values[i]),
+            }
+            for i in rank.tolist()
+        ]
+
+    def growth(self, metric: str, start: date, end: date) -> int:
+        lower, upper = _day_micros(start), _day_micros(end + timedelta(days=1))
+        total = 0
+        for segment, meta in zip(self.segments, self.manifest['segments']):
+            at, cumulative = segment['created_at'], segment[f'delta_{metric}_cum']
+
+            def between(lo: int, hi: int) -> int:
+                return int(cumulative[np.searchsorted(at, hi)] - cumulative[np.searchsorted(at, lo)])
+
+            total += between(lower, upper)
+            # эти сутки перезагружены в более новый сегмент
+            for day in meta['stale']:
+                if lower <= day * DAY < upper:
+                    total -= between(day * DAY, (day + 1) * DAY)
+        return total
+
+    def creator_videos(self, creator_id: str, start: date | None = None, end: date | None = None) -> int:
+        names = self.videos['creators']
+        code = int(np.searchsorted(names, creator_id))
+        if code >= len(names) or names[code] != creator_id:
+            return 0
+        offsets = self.videos['creator_offsets']
+        lo, hi = int(offsets[code]), int(offsets[code + 1])
+        if start is None:
+            return hi - lo
+        at = self.videos['creator_created_at'][lo:hi]
+        return int(np.searchsorted(at, _day_micros(end + timedelta(days=1))) - np.searchsorted(at, _day_micros(start)))
+
+    def answer(self, intent: Intent, data_version: int | None = None) -> list[dict] | None:
+        """Строки в том же виде, что у SQL-шаблона, или None, если ответить нечем
+        или данные собраны при другой версии data_version."""
+        self.sync()
+        if not self.ready:
+            return None
+        if data_version is not None and self.manifest['data_version'] != data_version:
+            return None
+        self.queries += 1
+        if intent.name == 'count_videos_above':
+            return [{'cnt': self.count_videos(intent.metric, intent.op, intent.threshold)}]
+        if intent.name == 'growth':
+            return [{'delta': self.growth(intent.metric, intent.date_range.start_date, intent.date_range.end_date)}]
+        if intent.name == 'top_videos':
+            return self.top_videos(intent.metric, min(intent.limit, settings.QUERY_MAX_ROWS + 1))
+        if intent.name == 'creator_videos':
+            dr = intent.date_range
+            return [{'cnt': self.creator_videos(intent.creator_id, dr and dr.start_date, dr and dr.end_date)}]
+        self.queries -= 1
+        return None
+
+    def stats(self) -> dict:
+        manifest = self.manifest or {}
+        return {
+            'generation': manifest.get('generation', 0),
+            'videos': manifest.get('video_rows', 0),
+            'snapshots': sum(s['rows'] for s in manifest.get('segments', ())),
+            'segments': len(self.segments),
+            'queries': self.queries,
+            'refreshes': self.refreshes,
+        }
+
+    # --- запись ---
+
+    @contextmanager
+    def _writer(self, wait: bool) -> Iterator[bool]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / 'lock', 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _publish(
+        self,
+        videos: _VideoRows,
+        snapshots: _SnapshotRows,
+        keep_segments: bool,
+        data_version: int | None,
+        days: dict[str, list[int]],
+        changed: set[int],
+    ) -> None:
+        previous = self.manifest if keep_segments and self.manifest else None
+        generation = (self.manifest or {}).get('generation', 0) + 1
+        segments = [
+            {**s, 'stale': sorted(set(s['stale']) | (changed & set(s['days'])))}
+            for s in (previous['segments'] if previous else [])
+        ]
+
+        _write_videos(self.directory / f'videos-{generation}', videos)
+        if len(snapshots):
+            created_at = np.array(snapshots.created_at, dtype=np.int64)
+            _write_segment(
+                self.directory / f'segment-{generation}',
+                np.array(snapshots.video, dtype=np.int32),
+                created_at,
+                np.array(snapshots.deltas, dtype=np.int64).reshape(-1, len(COUNTERS)),
+            )
+            segments.append({
+                'dir': f'segment-{generation}',
+                'rows': len(snapshots),
+                'days': np.unique(created_at // DAY).tolist(),
+                'stale': [],
+            })
+
+        if len(segments) > self.max_segments:
+            segments = [self._compact(segments, generation)]
+
+        manifest = {
+            'generation': generation,
+            'built_at': datetime.now(timezone.utc).isoformat(),
+            'data_version': data_version,
+            'days': days,
+            'videos': f'videos-{generation}',
+            'video_rows': len(videos.ids),
+            'segments': segments,
+        }
+        tmp = self.directory / f'{MANIFEST}.tmp'
+        tmp.write_text(json.dumps(manifest), encoding='utf-8')
+        os.replace(tmp, self.directory / MANIFEST)
+        self.refreshes += 1
+
+        # открытые другими воркерами mmap переживают удаление файла
+        referenced = {manifest['videos'], *(s['dir'] for s in segments)}
+        for path in self.directory.iterdir():
+            if path.is_dir() and path.name not in referenced:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _compact(self, segments: list[dict], generation: int) -> dict:
+        video, created_at, deltas = [], [], []
+        for meta in segments:
+            segment = _load_dir(self.directory / meta['dir'])
+            live = ~np.isin(segment['created_at'] // DAY, meta['stale'])
+            video.append(segment['video'][live])
+            created_at.append(segment['created_at'][live])
+            deltas.append(np.column_stack([np.diff(segment[f'delta_{c}_cum'])[live] for c in COUNTERS]))
+        created_at = np.concatenate(created_at)
+        name = f'merged-{generation}'
+        _write_segment(self.directory / name, np.concatenate(video), created_at, np.concatenate(deltas))
+        logger.info('Сегменты снапшотов слиты: {} -> {}', len(segments), name)
+        return {'dir': name, 'rows': int(len(created_at)), 'days': np.unique(created_at // DAY).tolist(), 'stale': []}
+
+    def build_from_json(self, path: str | Path) -> None:
+        started = time.perf_counter()
+        videos, snapshots = _VideoRows([]), _SnapshotRows()
+        for item in iter_videos(path):
+            published = item.get('video_created_at')
+            videos.add(
+                item['id'],
+                item.get('creator_id'),
+                _micros(datetime.fromisoformat(published)) if published else NULL_VALUE,
+                tuple(_count(item.get(c)) for c in COUNTERS),
+            )
+            code = videos.code(item['id'])
+            for snap in item.get('snapshots') or ():
+                snapshots.add(
+                    code,
+                    _micros(datetime.fromisoformat(snap['created_at'])),
+                    tuple(int(snap.get(f'delta_{c}') or 0) for c in COUNTERS),
+                )
+        days = _fingerprint(
+            np.array(snapshots.created_at, dtype=np.int64),
+            np.array(snapshots.deltas, dtype=np.int64).reshape(-1, len(COUNTERS)),
+        )
+        with self._writer(wait=True):
+            self.sync()
+            self._publish(videos, snapshots, keep_segments=False, data_version=None, days=days, changed=set())
+            self.sync()
+        logger.info('Колоночные данные собраны из {} за {:.2f} c', path, time.perf_counter() - started)
+
+    async def refresh(self, conn: asyncpg.Connection, rebuild: bool = False, wait: bool = False) -> bool:
+        """Перезагружает изменившиеся сутки снапшотов и перезаписывает видео; False, если
+        обновлять нечего или обновляет другой процесс."""
+        with self._writer(wait) as locked:
+            self.sync()
+            if not locked:
+                return False
+            started = time.perf_counter()
+            # манифест прежнего формата (без отпечатков суток) пересобирается
+            incremental = self.ready and not rebuild and 'days' in self.manifest
+            videos = _VideoRows(self.videos['id'].tolist() if incremental else [])
+            snapshots = _SnapshotRows()
+
+            async with conn.transaction(isolation='repeatable_read', readonly=True):
+                await conn.execute('SET LOCAL statement_timeout = 0')
+                data_version = None
+                if await conn.fetchval("SELECT to_regclass('bot_service.data_version') IS NOT NULL"):
+                    data_version = await conn.fetchval('SELECT version FROM bot_service.data_version WHERE id = 1')
+                if incremental and data_version is not None and data_version == self.manifest['data_version']:
+                    return False
+
+                days = {
+                    str(r['day']): [r['rows'], *(r[f'delta_{c}'] for c in COUNTERS)]
+                    for r in await conn.fetch(DAYS_SQL)
+                }
+                if incremental:
+                    known = self.manifest['days']
+                    changed = {int(d) for d in days.keys() | known.keys() if days.get(d) != known.get(d)}
+                    cursors = [
+                        conn.cursor(
+                            SNAPSHOTS_SQL + ' WHERE created_at >= $1 AND created_at < $2',
+                            EPOCH + timedelta(days=lo), EPOCH + timedelta(days=hi),
+                            prefetch=10_000,
+                        )
+                        for lo, hi in _day_ranges(changed)
+                    ]
+                else:
+                    changed = set()
+                    cursors = [conn.cursor(SNAPSHOTS_SQL, prefetch=10_000)]
+                for cursor in cursors:
+                    async for r in cursor:
+                        snapshots.add(
+                            videos.code(r['video_id']),
+                            _micros(r['created_at']),
+                            tuple(r[f'delta_{c}'] or 0 for c in COUNTERS),
+                        )
+                async for r in conn.cursor(VIDEOS_SQL, prefetch=10_000):
+                    videos.add(
+                        r['id'], r['creator_id'], _micros(r['video_created_at']),
+                        tuple(_count(r[c]) for c in COUNTERS),
+                    )
+
+            await asyncio.to_thread(self._publish, videos, snapshots, incremental, data_version, days, changed)
+            self.sync()
+            logger.info(
+                'Колоночные данные обновлены: видео {}, перезагружено суток {} ({} снапшотов), за {:.2f} c',
+                len(videos.ids), len(changed) if incremental else len(days), len(snapshots),
+                time.perf_counter() - started,
+            )
+            return True
+
+
+async def run_refresh(engine: ColumnarEngine, interval: float) -> None:
+    """Фоновая задача бота: refresh() раз в interval секунд."""
+    while True:
+        try:
+            async with acquire() as conn:
+                await engine.refresh(conn)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error('Обновление колоночных данных не удалось: {}', e)
+        await asyncio.sleep(interval)
+
+
+columnar = ColumnarEngine(Path(settings.COLUMNAR_DIR), settings.COLUMNAR_MAX_SEGMENTS)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description='Сборка колоночных данных для быстрых агрегатов')
+    parser.add_argument('command', choices=('build', 'refresh'))
+    parser.add_argument('path', type=Path, nargs='?', help='videos.json; без него данные берутся из БД')
+    args = parser.parse_args()
+
+    if args.path is not None:
+        columnar.build_from_json(args.path)
+        return
+
+    conn = await asyncpg.connect(settings.PG_DSN)
+    try:
+        await columnar.refresh(conn, rebuild=args.command == 'build', wait=True)
+    finally:
+        await conn.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
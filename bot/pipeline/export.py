@@ -0,0 +1,190 @@
+"""Потоковая выдача результата: короткий ответ в чат или файл-выгрузка.
+
+Строки из курсора складываются в память, пока их меньше
+RESULT_INLINE_MAX_ROWS и их отрисовка render_rows — ровно тот текст, что
+уйдёт в чат, — короче RESULT_INLINE_MAX_BYTES символов и вместе с шапкой
+ответа укладывается в лимит сообщения Telegram.
+Как только порог превышен, уже полученные и все следующие строки
+пишутся прямо в сжатый CSV (или Parquet, если установлен pyarrow), а в
+памяти остаётся только короткое превью — расход памяти не зависит от
+размера результата.
+"""
+import csv
+import gzip
+import json
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable
+
+from loguru import logger
+
+from config import settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+PARQUET_ROW_GROUP = 10_000
+TELEGRAM_MESSAGE_LIMIT = 4096
+# шапка ответа в чате: заголовок, вопрос (до 500 символов), строка о выгрузке
+ANSWER_HEADER_RESERVE = 700
+
+
+def render_rows(rows: list[dict]) -> str:
+    """Текст результата для чата."""
+    if rows and len(rows) == 1 and isinstance(rows[0], dict) and len(rows[0]) == 1:
+        only_value = next(iter(rows[0].values()))
+        if only_value is None:
+            return "0"
+        return str(only_value)
+
+    return json.dumps(rows, ensure_ascii=False, indent=2, default=str)
+
+
+def _rendered_len(row: dict) -> int:
+    """Сколько строка добавляет к render_rows: отступ в 2 пробела на каждую линию и ',\n'."""
+    text = json.dumps(row, ensure_ascii=False, indent=2, default=str)
+    return len(text) + 2 * (text.count('\n') + 1) + 2
+
+
+def _inline_budget() -> int:
+    return min(settings.RESULT_INLINE_MAX_BYTES, TELEGRAM_MESSAGE_LIMIT - ANSWER_HEADER_RESERVE)
+
+
+@dataclass
+class QueryResult:
+    rows: list[dict] = field(default_factory=list)
+    total_rows: int = 0
+    path: Path | None = None
+    truncated: bool = False
+
+
+class _CSVWriter:
+    suffix = '.csv.gz'
+
+    def __init__(self, path: Path, columns: list[str]) -> None:
+        self._file = gzip.open(path, 'wt', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, row: dict) -> None:
+        self._writer.writerow(row.values())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class _ParquetWriter:
+    suffix = '.parquet'
+
+    def __init__(self, path: Path, columns: list[str]) -> None:
+        self._path = path
+        self._columns = columns
+        self._batch: list[dict] = []
+        self._writer = None
+
+    def write(self, row: dict) -> None:
+        self._batch.append(row)
+        if len(self._batch) >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._batch:
+            return
+        schema = self._writer.schema if self._writer is not None else None
+        table = pa.Table.from_pylist(self._batch, schema=schema)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._path, table.schema, compression='zstd')
+        self._writer.write_table(table)
+        self._batch.clear()
+
+    def close(self) -> None:
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _writer_class():
+    if settings.EXPORT_FORMAT == 'parquet':
+        if pq is not None:
+            return _ParquetWriter
+        logger.warning('pyarrow не установлен, выгрузка будет в CSV')
+    return _CSVWriter
+
+
+def cleanup_exports(max_age: float | None = None) -> None:
+    max_age = settings.EXPORT_MAX_AGE if max_age is None else max_age
+    export_dir = Path(settings.EXPORT_DIR)
+    if not export_dir.exists():
+        return
+    deadline = time.time() - max_age
+    for path in export_dir.iterdir():
+        if path.is_file() and path.stat().st_mtime < deadline:
+            path.unlink(missing_ok=True)
+
+
+class ResultSink:
+    def __init__(self, max_rows: int) -> None:
+        self.max_rows = max_rows
+        self.result = QueryResult()
+        # "[\n" и "\n]" вокруг строк
+        self._inline_chars = 2
+        self._writer = None
+
+    @property
+    def full(self) -> bool:
+        return self.result.total_rows >= self.max_rows
+
+    def add(self, row: dict) -> None:
+        self.result.total_rows += 1
+        if self._writer is not None:
+            self._writer.write(row)
+            return
+
+        self.result.rows.append(row)
+        self._inline_chars += _rendered_len(row)
+        if (
+            len(self.result.rows) > settings.RESULT_INLINE_MAX_ROWS
+            or self._inline_chars > _inline_budget()
+        ):
+            self._switch_to_file()
+
+    def close(self) -> QueryResult:
+        if self._writer is not None:
+            self._writer.close()
+            logger.info('Результат выгружен в {}: {} строк', self.result.path, self.result.total_rows)
+        return self.result
+
+    def _switch_to_file(self) -> None:
+        cleanup_exports()
+        writer_cls = _writer_class()
+        export_dir = Path(settings.EXPORT_DIR)
+        export_dir.mkdir(parents=True, exist_ok=True)
+        path = export_dir / f'result_{uuid.uuid4().hex}{writer_cls.suffix}'
+
+        self._writer = writer_cls(path, list(self.result.rows[0].keys()))
+        for row in self.result.rows:
+            self._writer.write(row)
+        self.result.path = path
+        preview, size = [], 2
+        for row in self.result.rows[:settings.RESULT_PREVIEW_ROWS]:
+            size += _rendered_len(row)
+            if size > _inline_budget():
+                break
+            preview.append(row)
+        self.result.rows = preview
+
+
+def collect(rows: Iterable[dict], max_rows: int | None = None) -> QueryResult:
+    """Готовые строки (шаблон, колоночный движок) через те же лимиты, что и курсор."""
+    sink = ResultSink(max_rows or settings.QUERY_MAX_ROWS)
+    for row in rows:
+        if sink.full:
+            sink.result.truncated = True
+            break
+        sink.add(row)
+    return sink.close()
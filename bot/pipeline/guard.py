@@ -0,0 +1,99 @@
+"""Допуск запросов по оценке планировщика и ограниченное чтение результата.
+
+Перед выполнением запрос прогоняется через EXPLAIN (FORMAT JSON):
+- стоимость выше QUERY_MAX_COST — запрос отклоняется;
+- стоимость выше QUERY_SOFT_COST — запрос выполняется с урезанными
+  statement_timeout и числом строк.
+Сам запрос читается серверным курсором в read-only транзакции и
+складывается в ResultSink, который сам решает, отдать ли строки в чат
+или выгрузить в файл. Больше заданного числа строк не читается.
+"""
+import json
+import time
+from dataclasses import dataclass
+
+import asyncpg
+from loguru import logger
+
+from config import settings
+from pipeline.export import QueryResult, ResultSink
+
+
+class QueryRejected(ValueError):
+    pass
+
+
+@dataclass
+class PlanEstimate:
+    cost: float
+    rows: float
+
+
+@dataclass
+class Admission:
+    estimate: PlanEstimate
+    max_rows: int
+    timeout_ms: int
+    downgraded: bool
+
+
+async def explain(conn: asyncpg.Connection, sql: str, *args) -> PlanEstimate:
+    raw = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *args)
+    plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+    return PlanEstimate(cost=plan["Total Cost"], rows=plan["Plan Rows"])
+
+
+async def admit(conn: asyncpg.Connection, sql: str, *args) -> Admission:
+    estimate = await explain(conn, sql, *args)
+    if estimate.cost > settings.QUERY_MAX_COST:
+        logger.warning(
+            'Запрос отклонён: cost={:.0f} > {:.0f}, rows~{:.0f}: {}',
+            estimate.cost, settings.QUERY_MAX_COST, estimate.rows, sql,
+        )
+        raise QueryRejected(
+            "Запрос слишком тяжёлый для базы. Попробуйте сузить вопрос: период, автора или конкретные видео."
+        )
+
+    if estimate.cost > settings.QUERY_SOFT_COST:
+        logger.info('Запрос понижен в приоритете: cost={:.0f}, rows~{:.0f}', estimate.cost, estimate.rows)
+        return Admission(
+            estimate=estimate,
+            max_rows=settings.QUERY_SOFT_MAX_ROWS,
+            timeout_ms=settings.QUERY_SOFT_TIMEOUT_MS,
+            downgraded=True,
+        )
+
+    return Admission(
+        estimate=estimate,
+        max_rows=settings.QUERY_MAX_ROWS,
+        timeout_ms=settings.PG_STATEMENT_TIMEOUT_MS,
+        downgraded=False,
+    )
+
+
+async def fetch_guarded(conn: asyncpg.Connection, sql: str, *args) -> QueryResult:
+    started = time.perf_counter()
+    async with conn.transaction(readonly=True):
+        admission = await admit(conn, sql, *args)
+        await conn.execute(f"SET LOCAL statement_timeout = {int(admission.timeout_ms)}")
+
+        sink = ResultSink(admission.max_rows)
+        try:
+            async for record in conn.cursor(sql, *args, prefetch=settings.QUERY_CURSOR_PREFETCH):
+                if sink.full:
+                    sink.result.truncated = True
+                    break
+                sink.add(dict(record))
+        finally:
+            result = sink.close()
+
+    logger.info(
+        'SQL выполнен за {:.3f} c: cost={:.0f}, rows~{:.0f}, получено {}{}{}',
+        time.perf_counter() - started,
+        admission.estimate.cost,
+        admission.estimate.rows,
+        result.total_rows,
+        ' (обрезано)' if result.truncated else '',
+        ' (понижен)' if admission.downgraded else '',
+    )
+    return result
@@ -0,0 +1,73 @@
+"""Подстраховочные (hedged) запросы к нескольким моделям.
+
+race() запускает кандидатов по очереди: следующего — когда текущий
+работает дольше hedge_delay() своей модели или все запущенные уже упали.
+Побеждает первый успешный, остальные отменяются. Задержка — перцентиль
+LLM_HEDGE_PERCENTILE последних задержек модели, а пока замеров меньше
+LLM_HEDGE_MIN_SAMPLES — фиксированная LLM_HEDGE_DELAY. Кандидат, отменённый
+уже после своего порога, записывается временем до отмены (оценка снизу),
+чтобы медленные ответы не выпадали из окна.
+"""
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, TypeVar
+
+from loguru import logger
+
+from config import settings
+
+T = TypeVar('T')
+WINDOW = 500
+
+_latencies: dict[str, deque[float]] = {}
+
+
+def record_latency(model: str, seconds: float) -> None:
+    _latencies.setdefault(model, deque(maxlen=WINDOW)).append(seconds)
+
+
+def hedge_delay(model: str) -> float:
+    samples = _latencies.get(model)
+    if not samples or len(samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+        return settings.LLM_HEDGE_DELAY
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(settings.LLM_HEDGE_PERCENTILE * len(ordered)))]
+
+
+async def race(candidates: list[tuple[str, Callable[[], Awaitable[T]]]]) -> tuple[str, T]:
+    """Возвращает (имя, результат) первого успешного кандидата; если упали все — последнюю ошибку."""
+    pending = list(candidates)
+    running: dict[asyncio.Task, str] = {}
+    errors: list[BaseException] = []
+
+    def launch() -> float:
+        name, factory = pending.pop(0)
+        running[asyncio.create_task(factory())] = name
+        return hedge_delay(name)
+
+    timeout = launch()
+    try:
+        while running:
+            done, _ = await asyncio.wait(
+                running, timeout=timeout if pending else None, return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                logger.info(
+                    'Модель {} не ответила за {:.2f} c, подключаем {}',
+                    ', '.join(running.values()), timeout, pending[0][0],
+                )
+                timeout = launch()
+                continue
+            for task in done:
+                name = running.pop(task)
+                error = task.exception()
+                if error is None:
+                    return name, task.result()
+                logger.warning('Кандидат от {} отклонён: {}', name, error)
+                errors.append(error)
+            if not running and pending:
+                timeout = launch()
+        raise errors[-1]
+    finally:
+        for task in running:
+            task.cancel()
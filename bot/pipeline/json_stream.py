@@ -0,0 +1,43 @@
+"""Поиск JSON-объекта в потоке токенов от LLM.
+
+Модель отвечает {"sql": "..."}, иногда в ```json-блоке или с пояснением
+после. JsonObjectScanner получает текст кусками и отдаёт первый объект
+верхнего уровня, как только закрылась его последняя скобка, — дальше
+поток можно не читать. Скобки внутри строк и экранированные кавычки
+учитываются.
+"""
+
+
+class JsonObjectScanner:
+    def __init__(self) -> None:
+        self.text = ''
+        self._start: int | None = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> str | None:
+        """Добавляет кусок текста; возвращает объект целиком, когда он закрылся."""
+        offset = len(self.text)
+        self.text += chunk
+        for i, ch in enumerate(chunk, offset):
+            if self._start is None:
+                if ch == '{':
+                    self._start, self._depth = i, 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    return self.text[self._start:i + 1]
+        return None
@@ -0,0 +1,171 @@
+"""Асинхронный доступ к LLM для /db: общий клиент, лимиты и ретраи.
+
+Клиент создаётся один раз на процесс. Одновременно к модели уходит не
+больше LLM_MAX_CONCURRENCY запросов, а у каждого пользователя в работе
+один вопрос и не больше LLM_USER_QUEUE_SIZE ожидающих.
+
+stream() отдаёт ответ по кускам по мере генерации. Если потребитель
+закрывает генератор раньше конца (aclosing), соединение с моделью
+рвётся и слот освобождается сразу. usage приходит последним куском и при
+досрочной остановке не читается — тогда токены оцениваются по длине текста
+(CHARS_PER_TOKEN символов на токен), чтобы трейс и llm_tokens не пустели.
+"""
+import asyncio
+import random
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import AsyncIterator
+
+import openai
+from loguru import logger
+from openai import AsyncOpenAI
+
+from config import settings
+from pipeline.metrics import record_tokens
+
+RETRYABLE_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+CHARS_PER_TOKEN = 4
+
+_client: AsyncOpenAI | None = None
+_global_slots = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+_user_queues: dict[int, '_UserQueue'] = {}
+
+
+class LLMQueueFull(RuntimeError):
+    pass
+
+
+class _UserQueue:
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+def get_client() -> AsyncOpenAI:
+    global _client
+    if _client is None:
+        if not settings.GPT_CREDENTIALS:
+            raise RuntimeError("Не найден ключ GPT_CREDENTIALS в .env")
+        _client = AsyncOpenAI(
+            api_key=settings.GPT_CREDENTIALS,
+            base_url=settings.LLM_BASE_URL,
+            timeout=settings.LLM_TIMEOUT,
+            max_retries=0,
+        )
+    return _client
+
+
+def set_client(client) -> None:
+    """Подменяет клиента, например заглушкой для бенчмарков."""
+    global _client
+    _client = client
+
+
+@asynccontextmanager
+async def _user_slot(user_id: int | None) -> AsyncIterator[None]:
+    if user_id is None:
+        yield
+        return
+
+    queue = _user_queues.setdefault(user_id, _UserQueue())
+    if queue.pending >= settings.LLM_USER_QUEUE_SIZE:
+        raise LLMQueueFull("Слишком много вопросов в очереди, дождитесь ответа на предыдущие.")
+    queue.pending += 1
+    try:
+        async with queue.lock:
+            yield
+    finally:
+        queue.pending -= 1
+        if queue.pending == 0:
+            _user_queues.pop(user_id, None)
+
+
+async def complete(messages: list[dict], *, user_id: int | None = None, model: str | None = None):
+    model = model or settings.LLM_MODEL
+    async with _user_slot(user_id), _global_slots:
+        client = get_client()
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            try:
+                resp = await client.chat.completions.create(model=model, messages=messages)
+                usage = getattr(resp, 'usage', None)
+                record_tokens(model, usage)
+                if usage is not None:
+                    logger.info(
+                        'Ответ {}: prompt {} токенов, completion {}',
+                        model, usage.prompt_tokens, usage.completion_tokens,
+                    )
+                return resp
+            except RETRYABLE_ERRORS as e:
+                if attempt == settings.LLM_MAX_RETRIES:
+                    raise
+                delay = random.uniform(0, settings.LLM_RETRY_BASE_DELAY * 2 ** attempt)
+                logger.warning(
+                    'Запрос к {} не удался ({}), повтор {} через {:.2f} c',
+                    model, type(e).__name__, attempt + 1, delay,
+                )
+                await asyncio.sleep(delay)
+
+
+def estimate_usage(messages: list[dict], completion_chars: int) -> SimpleNamespace:
+    prompt_chars = sum(len(m.get('content') or '') for m in messages)
+    return SimpleNamespace(
+        prompt_tokens=-(-prompt_chars // CHARS_PER_TOKEN),
+        completion_tokens=-(-completion_chars // CHARS_PER_TOKEN),
+    )
+
+
+async def stream(messages: list[dict], *, user_id: int | None = None, model: str | None = None) -> AsyncIterator[str]:
+    """Куски текста ответа; повтор при ошибке — только пока не пришёл первый кусок."""
+    model = model or settings.LLM_MODEL
+    async with _user_slot(user_id), _global_slots:
+        client = get_client()
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            received = 0
+            finished = False
+            counted = False
+            try:
+                response = await client.chat.completions.create(
+                    model=model, messages=messages, stream=True, stream_options={'include_usage': True},
+                )
+                try:
+                    async for chunk in response:
+                        usage = getattr(chunk, 'usage', None)
+                        if usage is not None:
+                            counted = True
+                            record_tokens(model, usage)
+                            logger.info(
+                                'Ответ {}: prompt {} токенов, completion {}',
+                                model, usage.prompt_tokens, usage.completion_tokens,
+                            )
+                        text = chunk.choices[0].delta.content if chunk.choices else None
+                        if text:
+                            received += len(text)
+                            yield text
+                    finished = True
+                finally:
+                    if not finished and received:
+                        logger.info('Поток {} остановлен после {} символов', model, received)
+                    if not counted:
+                        usage = estimate_usage(messages, received)
+                        record_tokens(model, usage)
+                        logger.info(
+                            'Ответ {}: usage не получен, оценка prompt {} токенов, completion {}',
+                            model, usage.prompt_tokens, usage.completion_tokens,
+                        )
+                    await response.close()
+                return
+            except RETRYABLE_ERRORS as e:
+                if received or attempt == settings.LLM_MAX_RETRIES:
+                    raise
+                delay = random.uniform(0, settings.LLM_RETRY_BASE_DELAY * 2 ** attempt)
+                logger.warning(
+                    'Поток от {} не начался ({}), повтор {} через {:.2f} c',
+                    model, type(e).__name__, attempt + 1, delay,
+                )
+                await asyncio.sleep(delay)
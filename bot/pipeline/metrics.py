@@ -0,0 +1,215 @@
+"""Замеры стадий /db и локальный HTTP-эндпоинт в формате Prometheus.
+
+Каждый вопрос идёт внутри trace(): у него есть trace_id и путь
+(template / cache / llm), а stage() копит длительности стадий в
+гистограмму db_stage_seconds и в сам трейс. По завершении вопроса в лог
+пишется одна структурированная строка со всеми стадиями; в log.json она
+попадает в виде JSON.
+"""
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Iterator
+
+from aiohttp import web
+from loguru import logger
+
+from config import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs: dict) -> str:
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs.items()) + '}'
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...], buckets=DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        series = self._series.get(key)
+        if series is None:
+            # счётчики по корзинам, сумма, количество
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for key, (counts, total, count) in sorted(self._series.items()):
+            labels = dict(zip(self.label_names, key))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_labels({**labels, "le": bound})} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_labels({**labels, "le": "+Inf"})} {count}')
+            lines.append(f'{self.name}_sum{_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{_labels(labels)} {count}')
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    'db_stage_seconds', 'Длительность стадий обработки /db', ('stage', 'outcome', 'path'),
+)
+QUESTION_SECONDS = Histogram(
+    'db_question_seconds', 'Полное время ответа на вопрос /db', ('outcome', 'path'),
+)
+
+LLM_TOKENS = Histogram(
+    'llm_tokens', 'Токены на один вызов LLM', ('kind', 'model'),
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+
+_gauges: dict[str, Callable[[], dict]] = {}
+
+
+def register_gauges(prefix: str, collect: Callable[[], dict]) -> None:
+    """Добавляет в выдачу числовые поля словаря collect() как gauge prefix_<поле>."""
+    _gauges[prefix] = collect
+
+
+def render_metrics() -> str:
+    lines = STAGE_SECONDS.render() + QUESTION_SECONDS.render() + LLM_TOKENS.render()
+    for prefix, collect in _gauges.items():
+        for key, value in collect().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            lines.append(f'# TYPE {prefix}_{key} gauge')
+            lines.append(f'{prefix}_{key} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+@dataclass
+class Trace:
+    id: str
+    path: str = 'llm'
+    outcome: str | None = None
+    stages: dict[str, float] = field(default_factory=dict)
+    tokens: dict[str, int] = field(default_factory=dict)
+
+
+_current: ContextVar[Trace | None] = ContextVar('db_trace', default=None)
+
+
+def current_trace() -> Trace | None:
+    return _current.get()
+
+
+def set_path(path: str) -> None:
+    trace = _current.get()
+    if trace is not None:
+        trace.path = path
+
+
+@asynccontextmanager
+async def trace(**context) -> AsyncIterator[Trace]:
+    """Открывает трейс вопроса; вложенные вызовы переиспользуют внешний."""
+    existing = _current.get()
+    if existing is not None:
+        yield existing
+        return
+
+    current = Trace(id=uuid.uuid4().hex[:16])
+    token = _current.set(current)
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield current
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        _current.reset(token)
+        outcome = current.outcome or outcome
+        QUESTION_SECONDS.observe(elapsed, outcome=outcome, path=current.path)
+        logger.bind(
+            trace_id=current.id,
+            path=current.path,
+            outcome=outcome,
+            total_seconds=round(elapsed, 6),
+            stages={k: round(v, 6) for k, v in current.stages.items()},
+            tokens=current.tokens,
+            **context,
+        ).info('Вопрос {} обработан за {:.3f} c ({})', current.id, elapsed, current.path)
+
+
+def record_tokens(model: str, usage) -> None:
+    """Пишет usage ответа LLM в гистограмму llm_tokens и в текущий трейс."""
+    if usage is None:
+        return
+    details = getattr(usage, 'prompt_tokens_details', None)
+    counts = {
+        'prompt': getattr(usage, 'prompt_tokens', None),
+        'completion': getattr(usage, 'completion_tokens', None),
+        'cached': getattr(details, 'cached_tokens', None) if details is not None else None,
+    }
+    trace_ = _current.get()
+    for kind, value in counts.items():
+        if value is None:
+            continue
+        LLM_TOKENS.observe(value, kind=kind, model=model)
+        if trace_ is not None:
+            trace_.tokens[kind] = trace_.tokens.get(kind, 0) + value
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    trace_ = _current.get()
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name, outcome=outcome, path=trace_.path if trace_ else 'none')
+        if trace_ is not None:
+            trace_.stages[name] = trace_.stages.get(name, 0.0) + elapsed
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+
+
+def add_metrics_route(app: web.Application) -> None:
+    app.router.add_get('/metrics', _handle_metrics)
+
+
+_runner: web.AppRunner | None = None
+
+
+async def start_metrics_server() -> None:
+    global _runner
+    if not settings.METRICS_ENABLED or _runner is not None:
+        return
+    app = web.Application()
+    add_metrics_route(app)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, settings.METRICS_HOST, settings.METRICS_PORT).start()
+    logger.info('Метрики доступны на http://{}:{}/metrics', settings.METRICS_HOST, settings.METRICS_PORT)
+
+
+async def stop_metrics_server() -> None:
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
@@ -0,0 +1,205 @@
+"""Сборка компактного описания схемы под конкретный вопрос.
+
+Вместо всей схемы в промпт попадают только таблицы и столбцы, к которым
+относится вопрос. Связь ищется по индексу ключевых слов: части имён
+столбцов и таблиц плюс русские синонимы из ALIASES (сравниваются по началу
+слова, поэтому «просмотров» находит «просмотр»). Ключевые столбцы (id,
+ссылки, даты) и приросты delta_* остаются всегда. Если ничего не нашлось
+или вопрос называет дату, но ни один столбец с датой не подошёл, уходит
+вся схема (модель не знает, дата публикации это или замера) — лишние
+токены дешевле ответа без нужной таблицы.
+
+Рядом со столбцом пишется диапазон значений из pg_stats (гистограмма и
+частые значения после ANALYZE), чтобы модель видела масштаб чисел, формат
+дат и идентификаторов. Статистика перечитывается вместе со схемой.
+"""
+import re
+import time
+
+from loguru import logger
+
+from config import settings
+from dao.pool import acquire
+from dao.schema_cache import schema_cache
+
+# «новые просмотры», прирост и замеры считаются и по снапшотам, и по дневному срезу
+CHANGE_WORDS = ('нов', 'вырос', 'прирост', 'прибав', 'рост', 'замер', 'за час', 'отрицат', 'изменени')
+
+ALIASES: dict[str, tuple[str, ...]] = {
+    'videos': ('видео', 'ролик', 'клип'),
+    'video_snapshots': ('снапшот', 'почасов', 'по часам', 'каждый час', *CHANGE_WORDS),
+    'video_daily_stats': ('динамик', 'по дням', 'ежедневн', *CHANGE_WORDS),
+    'views_count': ('просмотр', 'охват'),
+    'likes_count': ('лайк', 'нрав'),
+    'comments_count': ('коммент',),
+    'reports_count': ('жалоб', 'репорт'),
+    'creator_id': ('креатор', 'автор', 'канал', 'блогер'),
+    'video_created_at': ('опублик', 'публикац', 'вышл', 'загруж'),
+    'day': ('день', 'дня', 'дню', 'дням', 'сутк'),
+}
+# остаются в выбранной таблице, даже если вопрос про них не говорит
+KEY_COLUMNS = ('id', 'video_id', 'creator_id', 'day', 'created_at', 'video_created_at')
+# таблицы, где дата — это день или час замера, а не публикации видео
+ACTIVITY_TABLES = {'video_snapshots', 'video_daily_stats'}
+DATE_TYPES = ('date', 'timestamp with time zone', 'timestamp without time zone')
+NUMERIC_TYPES = ('bigint', 'integer', 'smallint', 'numeric', 'real', 'double precision')
+
+SHORT_TYPES = {
+    'timestamp with time zone': 'timestamptz',
+    'timestamp without time zone': 'timestamp',
+    'character varying': 'varchar',
+    'double precision': 'float8',
+}
+
+_WORD = re.compile(r'\w+')
+_PERIOD = re.compile(
+    r'\b(?:\d{4}|январ\w*|феврал\w*|март\w*|апрел\w*|ма[яй]|июн\w*|июл\w*|август\w*|сентябр\w*|'
+    r'октябр\w*|ноябр\w*|декабр\w*|вчера|сегодня|недел\w*|месяц\w*|сутк\w*|час\w*)\b',
+    re.IGNORECASE,
+)
+
+STATS_SQL = """
+    SELECT tablename, attname,
+           histogram_bounds::text::text[] AS bounds,
+           most_common_vals::text::text[] AS common
+    FROM pg_stats
+    WHERE schemaname = 'public'
+"""
+
+
+def _keywords(name: str) -> set[str]:
+    words = {name.lower()}
+    words.update(part for part in name.lower().split('_') if len(part) > 2 and part not in ('count', 'at', 'id'))
+    words.update(ALIASES.get(name, ()))
+    if name.startswith('delta_'):
+        # приросты находятся по словам о росте; какой именно — решает schema_for
+        words.update(ALIASES['video_daily_stats'])
+    return words
+
+
+def _short_number(value: float) -> str:
+    for bound, suffix in ((1e9, 'B'), (1e6, 'M'), (1e3, 'k')):
+        if abs(value) >= bound:
+            return f'{value / bound:.3g}{suffix}'
+    return f'{value:.0f}' if value == int(value) else f'{value:g}'
+
+
+def _value_range(dtype: str, values: list[str]) -> str:
+    values = [v for v in values if v is not None]
+    if not values:
+        return ''
+    if dtype in NUMERIC_TYPES:
+        numbers = [float(v) for v in values]
+        return f' [{_short_number(min(numbers))}..{_short_number(max(numbers))}]'
+    if dtype in DATE_TYPES:
+        return f' [{min(values)[:10]}..{max(values)[:10]}]'
+    return f" напр. '{values[0]}'"
+
+
+class PromptBuilder:
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._tables: dict[str, list[tuple[str, str]]] | None = None
+        self._index: dict[str, set[tuple[str, str | None]]] = {}
+        self._ranges: dict[tuple[str, str], str] = {}
+        self._ranges_at: float | None = None
+
+    async def _refresh(self) -> dict[str, list[tuple[str, str]]]:
+        tables = await schema_cache.get_tables()
+        if tables is not self._tables:
+            index: dict[str, set[tuple[str, str | None]]] = {}
+            for table, columns in tables.items():
+                for word in _keywords(table):
+                    index.setdefault(word, set()).add((table, None))
+                for column, _ in columns:
+                    for word in _keywords(column):
+                        index.setdefault(word, set()).add((table, column))
+            self._index = index
+            self._tables = tables
+            self._ranges_at = None
+
+        if self._ranges_at is None or time.monotonic() - self._ranges_at >= self.ttl:
+            await self._load_ranges(tables)
+        return tables
+
+    async def _load_ranges(self, tables: dict[str, list[tuple[str, str]]]) -> None:
+        types = {(t, c): dtype for t, cols in tables.items() for c, dtype in cols}
+        async with acquire() as conn:
+            rows = await conn.fetch(STATS_SQL)
+        ranges = {}
+        for r in rows:
+            key = (r['tablename'], r['attname'])
+            if key in types:
+                ranges[key] = _value_range(types[key], list(r['bounds'] or []) + list(r['common'] or []))
+        self._ranges = ranges
+        self._ranges_at = time.monotonic()
+        logger.info('Диапазоны значений для промпта обновлены: {} столбцов', len(ranges))
+
+    def _match(self, question: str) -> tuple[set[str], set[tuple[str, str]]]:
+        text = question.lower()
+        words = _WORD.findall(text)
+        tables: set[str] = set()
+        columns: set[tuple[str, str]] = set()
+        for keyword, targets in self._index.items():
+            hit = keyword in text if ' ' in keyword else any(w.startswith(keyword) for w in words)
+            if not hit:
+                continue
+            for table, column in targets:
+                if column is None:
+                    tables.add(table)
+                else:
+                    columns.add((table, column))
+        return tables, columns
+
+    def render(self, tables: dict[str, list[tuple[str, str]]], keep: dict[str, set[str]] | None = None) -> str:
+        lines = []
+        for table in sorted(tables if keep is None else keep):
+            cols = [
+                f'{name} {SHORT_TYPES.get(dtype, dtype)}{self._ranges.get((table, name), "")}'
+                for name, dtype in tables[table]
+                if keep is None or name in keep[table]
+            ]
+            lines.append(f'TABLE {table}: ' + ', '.join(cols))
+        return '\n'.join(lines)
+
+    async def schema_for(self, question: str) -> str:
+        """Описание схемы для промпта: только нужные вопросу таблицы и столбцы."""
+        tables = await self._refresh()
+        if not settings.PROMPT_PRUNE_SCHEMA:
+            return self.render(tables)
+
+        hit_tables, hit_columns = self._match(question)
+        selected = set(hit_tables)
+        # порядок ALIASES задаёт, какую таблицу брать первой: videos раньше срезов
+        rank = {name: i for i, name in enumerate(ALIASES)}
+        for table, column in sorted(hit_columns, key=lambda tc: (rank.get(tc[0], len(rank)), tc)):
+            if column.startswith('delta_'):
+                continue
+            # столбец из невыбранной таблицы тянет её за собой, если его нет в выбранных
+            if not any(t == table or any(c == column for c, _ in tables[t]) for t in selected):
+                selected.add(table)
+        if not selected:
+            logger.info('Схема для вопроса не сужена: нет совпадений')
+            return self.render(tables)
+
+        hit_names = {c for _, c in hit_columns}
+        dated = bool(selected & ACTIVITY_TABLES) or any(
+            dtype in DATE_TYPES for t, c in hit_columns for name, dtype in tables[t] if name == c
+        )
+        if _PERIOD.search(question) and not dated:
+            logger.info('Схема для вопроса не сужена: период без столбца с датой')
+            return self.render(tables)
+
+        def wanted(name: str) -> bool:
+            return name in KEY_COLUMNS or name in hit_names or name.startswith('delta_')
+
+        keep = {table: {name for name, _ in tables[table] if wanted(name)} for table in selected}
+        text = self.render(tables, keep)
+        logger.info(
+            'Схема сужена до {} из {} таблиц, {} столбцов',
+            len(selected), len(tables), sum(len(v) for v in keep.values()),
+        )
+        return text
+
+
+prompt_builder = PromptBuilder(ttl=settings.SCHEMA_CACHE_TTL)
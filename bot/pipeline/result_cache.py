@@ -0,0 +1,124 @@
+"""Кэш результатов проверенного SQL с инвалидацией по водяному знаку данных.
+
+Водяной знак — номер версии в bot_service.data_version. Его увеличивают
+statement-триггеры на videos и video_snapshots, поэтому любая загрузка
+новых снапшотов (загрузчиком или вручную) делает кэш устаревшим. Версия
+перечитывается не чаще раза в RESULT_CACHE_WATERMARK_INTERVAL секунд.
+"""
+import json
+import time
+from collections import OrderedDict
+
+from loguru import logger
+
+from config import settings
+from dao.pool import acquire, execute_ddl
+
+DDL = """
+    CREATE SCHEMA IF NOT EXISTS bot_service;
+    CREATE TABLE IF NOT EXISTS bot_service.data_version (
+        id int PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        version bigint NOT NULL DEFAULT 0,
+        updated_at timestamptz NOT NULL DEFAULT now()
+    );
+    INSERT INTO bot_service.data_version (id) VALUES (1) ON CONFLICT DO NOTHING;
+
+    CREATE OR REPLACE FUNCTION bot_service.bump_data_version() RETURNS trigger AS $$
+    BEGIN
+        UPDATE bot_service.data_version SET version = version + 1, updated_at = now() WHERE id = 1;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE TRIGGER videos_data_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON videos
+        FOR EACH STATEMENT EXECUTE FUNCTION bot_service.bump_data_version();
+    CREATE OR REPLACE TRIGGER video_snapshots_data_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON video_snapshots
+        FOR EACH STATEMENT EXECUTE FUNCTION bot_service.bump_data_version();
+"""
+
+
+def normalize_sql(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int, max_entry_bytes: int, watermark_interval: float) -> None:
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.watermark_interval = watermark_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+        self._entries: OrderedDict[str, tuple[int, list[dict], int]] = OrderedDict()
+        self._watermark: int | None = None
+        self._watermark_checked_at = 0.0
+
+    async def init(self) -> None:
+        async with acquire() as conn:
+            await execute_ddl(conn, DDL)
+        self._watermark = None
+        logger.info('Кэш результатов готов, лимит {} байт', self.max_bytes)
+
+    async def watermark(self) -> int:
+        now = time.monotonic()
+        if self._watermark is None or now - self._watermark_checked_at >= self.watermark_interval:
+            async with acquire() as conn:
+                version = await conn.fetchval("SELECT version FROM bot_service.data_version WHERE id = 1")
+            if version != self._watermark:
+                self._drop_all()
+            self._watermark = version
+            self._watermark_checked_at = now
+        return self._watermark
+
+    def get(self, sql: str, watermark: int) -> list[dict] | None:
+        key = normalize_sql(sql)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != watermark:
+            if entry is not None:
+                self._pop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, sql: str, watermark: int, rows: list[dict]) -> None:
+        size = len(json.dumps(rows, ensure_ascii=False, default=str))
+        if size > self.max_entry_bytes:
+            return
+        key = normalize_sql(sql)
+        if key in self._entries:
+            self._pop(key)
+        self._entries[key] = (watermark, rows, size)
+        self.size_bytes += size
+        while self.size_bytes > self.max_bytes and self._entries:
+            self._pop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'watermark': self._watermark,
+        }
+
+    def _pop(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self.size_bytes -= size
+
+    def _drop_all(self) -> None:
+        self._entries.clear()
+        self.size_bytes = 0
+
+
+result_cache = ResultCache(
+    max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.RESULT_CACHE_MAX_ENTRY_BYTES,
+    watermark_interval=settings.RESULT_CACHE_WATERMARK_INTERVAL,
+)
@@ -0,0 +1,140 @@
+"""Кэш сгенерированного SQL по нормализованному вопросу и диапазону дат.
+
+В памяти держится LRU с ограничением по размеру и TTL, за ним стоит
+таблица bot_service.sql_cache, общая для всех реплик бота и переживающая
+перезапуски. Записи привязаны к версии промпта: при смене промпта в
+llm_make_sql старые записи удаляются в init().
+"""
+import hashlib
+import re
+import time
+from collections import OrderedDict
+
+from loguru import logger
+
+from config import settings
+from dao.pool import acquire, execute_ddl
+from user.schemas import DateRange
+
+DDL = """
+    CREATE SCHEMA IF NOT EXISTS bot_service;
+    CREATE TABLE IF NOT EXISTS bot_service.sql_cache (
+        key text PRIMARY KEY,
+        prompt_version text NOT NULL,
+        question text NOT NULL,
+        sql text NOT NULL,
+        created_at timestamptz NOT NULL DEFAULT now()
+    );
+"""
+
+_PUNCT = re.compile(r"[^\w\s\-]+")
+
+
+def canonical_question(question: str) -> str:
+    s = question.lower().replace("ё", "е")
+    s = _PUNCT.sub(" ", s)
+    return " ".join(s.split())
+
+
+def make_key(question: str, date_range: DateRange | None = None, extra_context: str | None = None) -> str:
+    parts = [canonical_question(question)]
+    if date_range:
+        parts.append(f"{date_range.start_date.isoformat()}..{date_range.end_date.isoformat()}")
+    if extra_context:
+        parts.append(" ".join(extra_context.split()))
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+class SQLCache:
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.prompt_version = ""
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    async def init(self, prompt_version: str) -> None:
+        self.prompt_version = prompt_version
+        self._entries.clear()
+        async with acquire() as conn:
+            await execute_ddl(conn, DDL)
+            result = await conn.execute(
+                "DELETE FROM bot_service.sql_cache WHERE prompt_version <> $1", prompt_version
+            )
+        logger.info('Кэш SQL готов, версия промпта {}, удалено устаревших записей: {}',
+                    prompt_version, result.split()[-1])
+
+    async def get(self, key: str) -> str | None:
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry is not None:
+            sql, expires_at = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return sql
+            del self._entries[key]
+
+        async with acquire() as conn:
+            sql = await conn.fetchval(
+                """
+                SELECT sql FROM bot_service.sql_cache
+                WHERE key = $1 AND prompt_version = $2
+                  AND created_at > now() - make_interval(secs => $3)
+                """,
+                key, self.prompt_version, self.ttl,
+            )
+        if sql is None:
+            self.misses += 1
+            return None
+
+        self.db_hits += 1
+        self._remember(key, sql)
+        return sql
+
+    async def put(self, key: str, question: str, sql: str) -> None:
+        self._remember(key, sql)
+        async with acquire() as conn:
+            await conn.execute(
+                """
+                INSERT INTO bot_service.sql_cache (key, prompt_version, question, sql)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (key) DO UPDATE
+                SET prompt_version = EXCLUDED.prompt_version,
+                    question = EXCLUDED.question,
+                    sql = EXCLUDED.sql,
+                    created_at = now()
+                """,
+                key, self.prompt_version, question, sql,
+            )
+
+    async def discard(self, key: str) -> None:
+        self._entries.pop(key, None)
+        async with acquire() as conn:
+            await conn.execute("DELETE FROM bot_service.sql_cache WHERE key = $1", key)
+
+    async def purge(self) -> None:
+        """Полностью очищает кэш, например после ручной правки промпта."""
+        self._entries.clear()
+        async with acquire() as conn:
+            await conn.execute("TRUNCATE bot_service.sql_cache")
+        logger.info('Кэш SQL очищен')
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'db_hits': self.db_hits,
+            'misses': self.misses,
+        }
+
+    def _remember(self, key: str, sql: str) -> None:
+        self._entries[key] = (sql, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+sql_cache = SQLCache(max_size=settings.SQL_CACHE_SIZE, ttl=settings.SQL_CACHE_TTL)
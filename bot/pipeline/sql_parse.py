@@ -0,0 +1,181 @@
+"""Разбор SQL от LLM в AST: проверка на read-only, лимит строк и канонизация.
+
+canonicalize() разбирает запрос sqlglot'ом и:
+- пропускает ровно один SELECT (в том числе WITH и UNION / INTERSECT / EXCEPT)
+  без изменяющих данные узлов, SELECT INTO, FOR UPDATE и опасных функций;
+- ставит LIMIT на самый внешний запрос или урезает уже стоящий;
+- выносит числовые литералы и типизированные даты в параметры $n с явным
+  приведением к тому типу, который дал бы литералу сам Postgres (5 — int4,
+  3000000000 — int8, 1.5 — numeric, '2025-11-01'::date — date). Строки,
+  порядковые номера в GROUP BY / ORDER BY и LIMIT остаются в тексте.
+
+Одинаковые по форме запросы дают одинаковый текст, поэтому asyncpg
+переиспользует подготовленные выражения из кэша соединения и не
+планирует их заново.
+"""
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+from zoneinfo import ZoneInfo
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+
+from config import settings
+
+DIALECT = 'postgres'
+
+_WRITE_NODES = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter,
+    exp.Command, exp.TruncateTable, exp.Copy, exp.Grant, exp.Into, exp.Lock,
+    exp.Set, exp.Transaction, exp.Commit, exp.Rollback,
+)
+_FORBIDDEN_FUNCTIONS = (
+    'PG_SLEEP', 'PG_READ', 'PG_LS_', 'PG_STAT_FILE', 'PG_TERMINATE', 'PG_CANCEL', 'PG_RELOAD',
+    'PG_ROTATE', 'PG_ADVISORY', 'LO_', 'DBLINK', 'SET_CONFIG', 'NEXTVAL', 'SETVAL', 'QUERY_TO_XML',
+)
+# внутри этих узлов литералы не бывают параметрами
+_INLINE_PARENTS = (exp.Limit, exp.Offset, exp.Fetch, exp.DataType, exp.Interval, exp.WindowSpec)
+
+_INT = re.compile(r'\d+')
+INT4_MAX = 2 ** 31 - 1
+INT8_MAX = 2 ** 63 - 1
+
+_DATE_TYPES = {
+    exp.DataType.Type.DATE: 'date',
+    exp.DataType.Type.TIMESTAMP: 'timestamp',
+    exp.DataType.Type.TIMESTAMPTZ: 'timestamptz',
+}
+
+
+class SQLRejected(ValueError):
+    pass
+
+
+@dataclass
+class CanonicalSQL:
+    sql: str
+    params: tuple[Any, ...]
+
+
+def _parse(sql: str) -> exp.Expression:
+    try:
+        statements = [s for s in sqlglot.parse(sql, read=DIALECT) if s is not None]
+    except ParseError as e:
+        raise SQLRejected(f"Не удалось разобрать SQL: {e}") from e
+    if len(statements) != 1:
+        raise SQLRejected("Нужен ровно один запрос.")
+    return statements[0]
+
+
+def _check_read_only(root: exp.Expression) -> None:
+    if not isinstance(root, (exp.Select, exp.SetOperation)):
+        raise SQLRejected("Разрешены только SELECT (включая WITH).")
+
+    for node in root.walk():
+        if isinstance(node, _WRITE_NODES):
+            raise SQLRejected(f"Запрещена конструкция {node.key.upper()}.")
+        if isinstance(node, exp.Select) and node.args.get('locks'):
+            raise SQLRejected("Запрещены блокировки строк (FOR UPDATE / FOR SHARE).")
+        if isinstance(node, exp.Func):
+            name = (node.name if isinstance(node, exp.Anonymous) else node.sql_name()).upper()
+            if name.startswith(_FORBIDDEN_FUNCTIONS):
+                raise SQLRejected(f"Запрещена функция {name.lower()}.")
+
+
+def _clamp_limit(root: exp.Expression, default_rows: int, max_rows: int) -> None:
+    limit = root.args.get('limit')
+    value = None
+    if isinstance(limit, exp.Limit):
+        value = limit.expression
+    elif isinstance(limit, exp.Fetch):
+        value = limit.args.get('count')
+
+    if isinstance(value, exp.Literal) and not value.is_string and _INT.fullmatch(value.name):
+        if int(value.name) <= max_rows:
+            return
+        rows = max_rows
+    else:
+        rows = default_rows if limit is None else max_rows
+    root.set('limit', exp.Limit(expression=exp.Literal.number(rows)))
+
+
+def _is_ordinal(literal: exp.Literal) -> bool:
+    parent = literal.parent
+    if isinstance(parent, exp.Group):
+        return True
+    return isinstance(parent, exp.Ordered) and isinstance(parent.parent, exp.Order)
+
+
+def _keeps_inline(node: exp.Expression) -> bool:
+    return node.find_ancestor(*_INLINE_PARENTS) is not None
+
+
+def _number_param(text: str) -> tuple[Any, str] | None:
+    if _INT.fullmatch(text):
+        value = int(text)
+        if value <= INT4_MAX:
+            return value, 'INT'
+        if value <= INT8_MAX:
+            return value, 'BIGINT'
+    try:
+        return Decimal(text), 'DECIMAL'
+    except ArithmeticError:
+        return None
+
+
+def _date_param(text: str, kind: str) -> Any | None:
+    try:
+        if kind == 'date':
+            return date.fromisoformat(text)
+        value = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if kind == 'timestamptz' and value.tzinfo is None:
+        # так же, как Postgres читает литерал: в часовом поясе сессии
+        value = value.replace(tzinfo=ZoneInfo(settings.PG_TIMEZONE))
+    if kind == 'timestamp' and value.tzinfo is not None:
+        return None
+    return value
+
+
+def _parameterize(root: exp.Expression) -> tuple[Any, ...]:
+    params: list[Any] = []
+
+    def placeholder() -> exp.Parameter:
+        return exp.Parameter(this=exp.Literal.number(len(params)))
+
+    # список заранее: дерево меняется по ходу обхода
+    for node in list(root.walk(bfs=False)):
+        if isinstance(node, exp.Cast) and isinstance(node.this, exp.Literal) and node.this.is_string:
+            kind = _DATE_TYPES.get(node.to.this)
+            value = _date_param(node.this.name, kind) if kind else None
+            if value is None or _keeps_inline(node):
+                continue
+            params.append(value)
+            node.set('this', placeholder())
+        elif isinstance(node, exp.Literal) and not node.is_string:
+            if node.parent is None or _is_ordinal(node) or _keeps_inline(node):
+                continue
+            number = _number_param(node.name)
+            if number is None:
+                continue
+            value, type_name = number
+            params.append(value)
+            node.replace(exp.Cast(this=placeholder(), to=exp.DataType.build(type_name)))
+    return tuple(params)
+
+
+def canonicalize(sql: str, default_rows: int | None = None, max_rows: int | None = None) -> CanonicalSQL:
+    root = _parse(sql)
+    _check_read_only(root)
+    _clamp_limit(
+        root,
+        settings.SQL_DEFAULT_LIMIT if default_rows is None else default_rows,
+        settings.QUERY_MAX_ROWS if max_rows is None else max_rows,
+    )
+    params = _parameterize(root)
+    return CanonicalSQL(sql=root.sql(dialect=DIALECT), params=params)
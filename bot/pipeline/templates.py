@@ -0,0 +1,71 @@
+"""Готовые параметризованные запросы для типовых вопросов.
+
+Если parse_intent распознал вопрос, SQL берётся отсюда и выполняется
+напрямую, без LLM. Имена столбцов и операторы подставляются только из
+белых списков в user.schemas, значения передаются параметрами.
+"""
+from datetime import datetime, time, timedelta, timezone
+
+from config import settings
+from dao.pool import acquire
+from pipeline.export import QueryResult, collect
+from pipeline.result_cache import result_cache
+from user.schemas import Intent
+
+
+def _day_start(day) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def build_template_sql(intent: Intent) -> tuple[str, list]:
+    if intent.name == "count_videos_above":
+        return (
+            f"SELECT COUNT(*) AS cnt FROM videos WHERE {intent.metric} {intent.op} $1",
+            [intent.threshold],
+        )
+
+    if intent.name == "growth":
+        return (
+            f"SELECT COALESCE(SUM(delta_{intent.metric}), 0) AS delta "
+            "FROM video_daily_stats WHERE day BETWEEN $1 AND $2",
+            [intent.date_range.start_date, intent.date_range.end_date],
+        )
+
+    if intent.name == "top_videos":
+        return (
+            f"SELECT id, creator_id, {intent.metric} FROM videos "
+            f"ORDER BY {intent.metric} DESC NULLS LAST LIMIT $1",
+            # на строку больше лимита выгрузки, чтобы collect отметил обрезку
+            [min(intent.limit, settings.QUERY_MAX_ROWS + 1)],
+        )
+
+    if intent.name == "creator_videos":
+        if intent.date_range is None:
+            return "SELECT COUNT(*) AS cnt FROM videos WHERE creator_id = $1", [intent.creator_id]
+        return (
+            "SELECT COUNT(*) AS cnt FROM videos WHERE creator_id = $1 "
+            "AND video_created_at >= $2 AND video_created_at < $3",
+            [
+                intent.creator_id,
+                _day_start(intent.date_range.start_date),
+                _day_start(intent.date_range.end_date + timedelta(days=1)),
+            ],
+        )
+
+    raise ValueError(f"Нет шаблона для намерения {intent.name}")
+
+
+async def run_template(intent: Intent) -> tuple[str, QueryResult]:
+    sql, args = build_template_sql(intent)
+    cache_key = f"{sql} -- {args!r}"
+    watermark = await result_cache.watermark()
+    cached = result_cache.get(cache_key, watermark)
+    if cached is not None:
+        return sql, collect(cached)
+
+    async with acquire() as conn:
+        result = collect(dict(r) for r in await conn.fetch(sql, *args))
+
+    if result.path is None:
+        result_cache.put(cache_key, watermark, result.rows)
+    return sql, result
@@ -0,0 +1,177 @@
+"""Webhook-режим: aiohttp-сервер aiogram и несколько процессов-воркеров.
+
+Каждый воркер поднимает своё приложение на WEBAPP_HOST:WEBAPP_PORT с
+SO_REUSEPORT, ядро раскидывает входящие соединения между ними. Вебхук в
+Telegram регистрирует только воркер 0. В режиме WEBHOOK_LOCAL вебхук не
+регистрируется вовсе, и сервер слушает обычный HTTP: апдейты можно
+присылать руками, например curl -X POST localhost:8080/webhook -d @update.json.
+
+При остановке сервер перестаёт принимать запросы, а in_flight даёт
+уже начатым хендлерам до DRAIN_TIMEOUT секунд закончиться, прежде чем
+закроется пул и остальной пайплайн.
+"""
+import asyncio
+import multiprocessing
+import signal
+import ssl
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import FSInputFile, TelegramObject
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from loguru import logger
+
+from config import bot, dp, settings
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """Считает апдейты в обработке и умеет дождаться, пока они закончатся."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        self.count += 1
+        self._idle.clear()
+        try:
+            return await handler(event, data)
+        finally:
+            self.count -= 1
+            if not self.count:
+                self._idle.set()
+
+    async def drain(self, timeout: float | None = None) -> None:
+        if not self.count:
+            return
+        timeout = settings.DRAIN_TIMEOUT if timeout is None else timeout
+        logger.info('Ждём завершения {} апдейтов (до {:.0f} c)', self.count, timeout)
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning('Не дождались {} апдейтов за {:.0f} c', self.count, timeout)
+
+
+in_flight = InFlightMiddleware()
+
+
+async def drain_updates() -> None:
+    await in_flight.drain()
+
+
+def _ssl_context() -> ssl.SSLContext | None:
+    if settings.WEBHOOK_LOCAL or not settings.WEBHOOK_SSL_CERT:
+        return None
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(settings.WEBHOOK_SSL_CERT, settings.WEBHOOK_SSL_KEY)
+    return context
+
+
+async def set_webhook() -> None:
+    if not settings.WEBHOOK_BASE_URL:
+        raise RuntimeError('Для webhook-режима нужен WEBHOOK_BASE_URL')
+    url = settings.WEBHOOK_BASE_URL.rstrip('/') + settings.WEBHOOK_PATH
+    certificate = FSInputFile(settings.WEBHOOK_SSL_CERT) if settings.WEBHOOK_SSL_CERT else None
+    await bot.set_webhook(
+        url,
+        certificate=certificate,
+        secret_token=settings.WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=settings.DROP_PENDING_UPDATES,
+    )
+    logger.info('Вебхук зарегистрирован: {}', url)
+
+
+def build_app(worker: int = 0) -> web.Application:
+    app = web.Application()
+    # shutdown диспетчера (с ожиданием апдейтов) должен отработать раньше,
+    # чем SimpleRequestHandler закроет сессию бота
+    setup_application(app, dp, bot=bot)
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=settings.WEBHOOK_SECRET,
+        handle_in_background=True,
+    ).register(app, path=settings.WEBHOOK_PATH)
+
+    if worker == 0 and not settings.WEBHOOK_LOCAL:
+        async def on_startup(app: web.Application) -> None:
+            await set_webhook()
+
+        app.on_startup.append(on_startup)
+    return app
+
+
+async def serve(worker: int = 0) -> None:
+    if settings.WEB_WORKERS > 1:
+        # у каждого воркера свой /metrics: METRICS_PORT + номер воркера
+        settings.METRICS_PORT += worker
+
+    runner = web.AppRunner(build_app(worker), access_log=None, shutdown_timeout=settings.DRAIN_TIMEOUT)
+    await runner.setup()
+    site = web.TCPSite(
+        runner,
+        settings.WEBAPP_HOST,
+        settings.WEBAPP_PORT,
+        ssl_context=_ssl_context(),
+        reuse_port=settings.WEB_WORKERS > 1,
+    )
+    await site.start()
+    logger.info(
+        'Воркер {} слушает {}:{}{}', worker, settings.WEBAPP_HOST, settings.WEBAPP_PORT,
+        ' (локальный режим)' if settings.WEBHOOK_LOCAL else '',
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        logger.info('Воркер {} останавливается', worker)
+        await runner.cleanup()
+
+
+def _run_worker(worker: int, setup: Callable[[], None]) -> None:
+    setup()
+    try:
+        asyncio.run(serve(worker))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_webhook(setup: Callable[[], None]) -> None:
+    """Запускает WEB_WORKERS процессов; при одном воркере обходится без них.
+
+    setup настраивает диспетчер (роутеры, мидлвари, хуки) и вызывается в
+    каждом воркере: процессы стартуют через spawn и не наследуют состояние.
+    """
+    if settings.WEB_WORKERS <= 1:
+        _run_worker(0, setup)
+        return
+
+    context = multiprocessing.get_context('spawn')
+    workers = [
+        context.Process(target=_run_worker, args=(i, setup), name=f'webhook-{i}')
+        for i in range(settings.WEB_WORKERS)
+    ]
+    for process in workers:
+        process.start()
+
+    def forward(signum, frame) -> None:
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in workers:
+        process.join()
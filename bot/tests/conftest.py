@@ -0,0 +1,17 @@
+import os
+import sys
+from pathlib import Path
+
+# config.Settings требует эти переменные; в офлайн-тестах к БД и Telegram не ходим
+for name, value in {
+    'BOT_TOKEN': '123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA',
+    'POSTGRES_DB': 'test',
+    'POSTGRES_USER': 'test',
+    'POSTGRES_PASSWORD': 'test',
+    'POSTGRES_HOST': '127.0.0.1',
+    'POSTGRES_PORT': '5432',
+    'METRICS_ENABLED': 'false',
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
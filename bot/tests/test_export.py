@@ -0,0 +1,44 @@
+"""Выбор между ответом в чат и файлом: текст в чате не длиннее лимита Telegram."""
+import pytest
+
+import gpt
+from config import settings
+from pipeline.export import TELEGRAM_MESSAGE_LIMIT, collect, render_rows
+
+# шапка, которую добавляет user_router, с вопросом максимальной длины
+HEADER = "✅ Ответ от Data-GPT\n\nЗапрос: " + "в" * 500 + "\n\n"
+
+
+@pytest.fixture(autouse=True)
+def export_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, 'EXPORT_DIR', str(tmp_path))
+
+
+def rows(count: int, columns: int = 8) -> list[dict]:
+    return [{f'c{j}': i * 10 + j for j in range(columns)} for i in range(count)]
+
+
+def test_short_columns_over_the_limit_go_to_file():
+    # 46 строк по 8 коротких столбцов: компактный JSON < 3000, а с отступами ~4.8k
+    result = collect(rows(46))
+    assert result.path is not None
+    answer = gpt._build_answer('SELECT 1', result)
+    assert len(HEADER + answer.text) <= TELEGRAM_MESSAGE_LIMIT
+
+
+@pytest.mark.parametrize('columns', [1, 2, 8, 20])
+def test_inline_answer_fits_telegram_at_the_boundary(columns):
+    for count in range(1, settings.RESULT_INLINE_MAX_ROWS + 2):
+        result = collect(rows(count, columns))
+        answer = gpt._build_answer('SELECT 1', result)
+        assert len(HEADER + answer.text) <= TELEGRAM_MESSAGE_LIMIT, (count, columns)
+        if result.path is None:
+            assert answer.text == render_rows(result.rows)
+
+
+def test_wide_rows_keep_preview_short():
+    wide = [{'text': 'ы' * 2000} for _ in range(5)]
+    result = collect(wide)
+    assert result.path is not None
+    answer = gpt._build_answer('SELECT 1', result)
+    assert len(HEADER + answer.text) <= TELEGRAM_MESSAGE_LIMIT
@@ -0,0 +1,159 @@
+"""Подстраховка моделей и исправление SQL на заглушке LLM, без БД."""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+import pytest
+
+import gpt
+from bench.fake_llm import FakeLLMClient
+from config import settings
+from pipeline import hedge, llm
+from pipeline.guard import PlanEstimate
+
+PRIMARY = settings.LLM_MODEL
+BACKUP = 'backup/model'
+BROKEN_SQL = 'SELECT nope FROM videos'
+QUESTION = 'Сколько лайков у всех видео вместе?'
+
+
+class FakeConnection:
+    def transaction(self, **kwargs):
+        @asynccontextmanager
+        async def transaction():
+            yield
+        return transaction()
+
+
+@asynccontextmanager
+async def fake_acquire():
+    yield FakeConnection()
+
+
+async def fake_explain(conn, sql, *args):
+    if 'nope' in sql:
+        raise asyncpg.exceptions.UndefinedColumnError('column "nope" does not exist')
+    return PlanEstimate(cost=1.0, rows=1.0)
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    monkeypatch.setattr(gpt, 'acquire', fake_acquire)
+    monkeypatch.setattr(gpt, 'explain', fake_explain)
+    monkeypatch.setattr(settings, 'LLM_STREAM', True)
+    monkeypatch.setattr(settings, 'LLM_HEDGE_MODELS', [])
+    monkeypatch.setattr(settings, 'LLM_HEDGE_DELAY', 0.05)
+    monkeypatch.setattr(settings, 'LLM_REPAIR_ATTEMPTS', 1)
+    monkeypatch.setattr(hedge, '_latencies', {})
+    yield
+    llm.set_client(None)
+
+
+def use_client(**kwargs) -> FakeLLMClient:
+    client = FakeLLMClient(**kwargs)
+    llm.set_client(client)
+    return client
+
+
+def test_race_launches_next_candidate_after_delay():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append('slow')
+            raise
+
+    async def fast():
+        await asyncio.sleep(0.01)
+        return 'fast'
+
+    started = time.perf_counter()
+    name, result = asyncio.run(hedge.race([('a', slow), ('b', fast)]))
+    assert (name, result) == ('b', 'fast')
+    assert time.perf_counter() - started < 1
+    assert cancelled == ['slow']
+
+
+def test_race_raises_last_error_when_all_fail():
+    async def fail(message):
+        raise ValueError(message)
+
+    with pytest.raises(ValueError, match='второй'):
+        asyncio.run(hedge.race([('a', lambda: fail('первый')), ('b', lambda: fail('второй'))]))
+
+
+def test_hedge_fires_for_slow_primary(monkeypatch):
+    monkeypatch.setattr(settings, 'LLM_HEDGE_MODELS', [BACKUP])
+    client = use_client(model_latency={PRIMARY: 3.0, BACKUP: 0.05})
+
+    started = time.perf_counter()
+    sql = asyncio.run(gpt.generate_sql(QUESTION, 'TABLE videos: id text', user_id=1))
+    assert 'likes_count' in sql
+    assert time.perf_counter() - started < 1
+    assert client.calls == 2
+    # отменённая основная модель попадает в окно задержек, а не выпадает из него
+    assert len(hedge._latencies[PRIMARY]) == 1
+    assert hedge._latencies[PRIMARY][0] >= settings.LLM_HEDGE_DELAY
+
+
+def test_candidate_rejected_by_explain_starts_backup_at_once(monkeypatch):
+    monkeypatch.setattr(settings, 'LLM_HEDGE_MODELS', [BACKUP])
+    monkeypatch.setattr(settings, 'LLM_HEDGE_DELAY', 10.0)
+    client = use_client(latency=0.01, model_sql={PRIMARY: BROKEN_SQL})
+
+    started = time.perf_counter()
+    sql = asyncio.run(gpt.generate_sql(QUESTION, 'TABLE videos: id text'))
+    assert 'nope' not in sql
+    assert time.perf_counter() - started < 1
+    assert client.calls == 2
+
+
+def _answer_with_db(monkeypatch, fail_times: int) -> tuple[list[str], FakeLLMClient]:
+    executed = []
+
+    async def run_sql(sql):
+        executed.append(sql)
+        if len(executed) <= fail_times:
+            raise asyncpg.exceptions.DivisionByZeroError('division by zero')
+        return gpt.QueryResult(rows=[{'likes': 42}], total_rows=1)
+
+    async def schema_for(question):
+        return 'TABLE videos: id text, likes_count bigint'
+
+    async def cache_get(key):
+        return None
+
+    async def cache_put(key, question, sql):
+        pass
+
+    monkeypatch.setattr(gpt, 'run_sql', run_sql)
+    monkeypatch.setattr(gpt.prompt_builder, 'schema_for', schema_for)
+    monkeypatch.setattr(gpt.sql_cache, 'get', cache_get)
+    monkeypatch.setattr(gpt.sql_cache, 'put', cache_put)
+    client = use_client(latency=0.01)
+    return executed, client
+
+
+def test_one_repair_round_after_postgres_error(monkeypatch):
+    executed, client = _answer_with_db(monkeypatch, fail_times=1)
+
+    answer = asyncio.run(gpt._answer(QUESTION, None, 1, None))
+    assert answer.text == '42'
+    assert len(executed) == 2
+    assert client.calls == 2
+    # второй запрос к модели — просьба исправить упавший SQL с текстом ошибки
+    repair = client.chat.completions.requests[1]
+    assert repair[-2]['role'] == 'assistant' and executed[0] in repair[-2]['content']
+    assert 'division by zero' in repair[-1]['content']
+
+
+def test_repair_gives_up_after_configured_attempts(monkeypatch):
+    executed, client = _answer_with_db(monkeypatch, fail_times=10)
+
+    with pytest.raises(asyncpg.exceptions.DivisionByZeroError):
+        asyncio.run(gpt._answer(QUESTION, None, 1, None))
+    assert len(executed) == settings.LLM_REPAIR_ATTEMPTS + 1
+    assert client.calls == settings.LLM_REPAIR_ATTEMPTS + 1
@@ -0,0 +1,35 @@
+"""Учёт токенов при потоковом ответе LLM, на заглушке."""
+import asyncio
+
+import pytest
+
+import gpt
+from bench.fake_llm import FakeLLMClient
+from config import settings
+from pipeline import llm
+from pipeline.metrics import trace
+
+QUESTION = 'Сколько лайков у всех видео вместе?'
+
+
+@pytest.fixture(autouse=True)
+def fake_client():
+    llm.set_client(FakeLLMClient(latency=0.01))
+    yield
+    llm.set_client(None)
+
+
+@pytest.mark.parametrize('streaming', [True, False])
+def test_tokens_recorded(monkeypatch, streaming):
+    monkeypatch.setattr(settings, 'LLM_STREAM', streaming)
+
+    async def ask():
+        async with trace() as current:
+            raw = await gpt.llm_make_sql(QUESTION, 'TABLE videos: id text, likes_count bigint')
+        return raw, current.tokens
+
+    raw, tokens = asyncio.run(ask())
+    assert '"sql"' in raw
+    # поток обрывается на закрытой JSON-скобке, usage-кусок до нас не доходит
+    assert tokens.get('prompt', 0) > 0
+    assert tokens.get('completion', 0) > 0
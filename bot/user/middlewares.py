@@ -0,0 +1,86 @@
+import asyncio
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message
+from loguru import logger
+
+from config import settings
+
+
+class TokenBucket:
+    """Ведро токенов с резервированием: take() возвращает, сколько ждать до своего токена."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        self._refill(time.monotonic())
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def take(self) -> float:
+        wait = self.delay()
+        self.tokens -= 1
+        return wait
+
+    @property
+    def full(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Ограничивает частоту хендлеров с флагом throttle: на пользователя и на весь бот.
+
+    Если токена нет, но дождаться его можно за RATE_MAX_WAIT, пользователь
+    получает сообщение, что вопрос в очереди, и хендлер запускается позже.
+    Иначе вопрос отклоняется.
+    """
+
+    def __init__(self) -> None:
+        self.global_bucket = TokenBucket(settings.RATE_GLOBAL_PER_SECOND, settings.RATE_GLOBAL_BURST)
+        self.user_buckets: dict[int, TokenBucket] = {}
+
+    def _user_bucket(self, user_id: int) -> TokenBucket:
+        bucket = self.user_buckets.get(user_id)
+        if bucket is None:
+            if len(self.user_buckets) >= 10_000:
+                self.user_buckets = {k: b for k, b in self.user_buckets.items() if not b.full}
+            bucket = self.user_buckets[user_id] = TokenBucket(
+                settings.RATE_USER_PER_MINUTE / 60, settings.RATE_USER_BURST,
+            )
+        return bucket
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not get_flag(data, 'throttle') or event.from_user is None:
+            return await handler(event, data)
+
+        user_bucket = self._user_bucket(event.from_user.id)
+        wait = max(user_bucket.delay(), self.global_bucket.delay())
+        if wait > settings.RATE_MAX_WAIT:
+            logger.info('Пользователь {} упёрся в лимит, ждать {:.0f} c', event.from_user.id, wait)
+            await event.answer(
+                f"🚦 Слишком много вопросов. Попробуйте снова через {math.ceil(wait)} c."
+            )
+            return None
+
+        wait = max(user_bucket.take(), self.global_bucket.take())
+        if wait > 0:
+            await event.answer(f"⏳ Вопрос в очереди, начну примерно через {math.ceil(wait)} c.")
+            await asyncio.sleep(wait)
+        return await handler(event, data)
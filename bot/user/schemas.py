@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import re
 from datetime import date
-from typing import Optional
+from typing import Literal, Optional
 
 from pydantic import BaseModel, Field, field_validator, model_validator
 
@@ -31,12 +31,98 @@ _RANGE_DATE_PATTERN = re.compile(
     re.IGNORECASE,
 )
 
+_CROSS_MONTH_RANGE_PATTERN = re.compile(
+    r"с\s+(?P<start_day>\d{1,2})\s+(?P<start_month>января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря)(?:\s+(?P<start_year>\d{4}))?"
+    r"\s+по\s+(?P<end_day>\d{1,2})\s+(?P<end_month>января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря)\s+(?P<year>\d{4})",
+    re.IGNORECASE,
+)
+
+_METRICS = {
+    "просмотр": "views_count",
+    "лайк": "likes_count",
+    "коммент": "comments_count",
+    "жалоб": "reports_count",
+}
+
+_METRIC = r"(?P<metric>просмотр|лайк|коммент|жалоб)\w*"
+
+_NUMBER = r"(?P<number>\d{1,3}(?:[ \u00a0]\d{3})+|\d+(?:[.,]\d+)?)\s*(?P<unit>тыс\w*\.?|млн\.?|миллион\w*)?"
+
+_COMPARISONS = {
+    "больше": ">",
+    "более": ">",
+    "свыше": ">",
+    "меньше": "<",
+    "менее": "<",
+}
+
+_MONTH = r"(?:января|февраля|марта|апреля|мая|июня|июля|августа|сентября|октября|ноября|декабря)"
+
+# Дата или период целиком, в тех формах, которые понимает parse_date_range
+_DATE = (
+    r"(?:(?:за|в)\s+)?"
+    r"(?:с\s+\d{1,2}(?:\s+" + _MONTH + r"(?:\s+\d{4})?)?\s+по\s+\d{1,2}\s+" + _MONTH + r"\s+\d{4}"
+    r"|\d{1,2}\s+" + _MONTH + r"\s+\d{4})"
+    r"(?:\s+года)?(?:\s+включительно)?"
+)
+
+# Шаблоны должны покрывать вопрос целиком (fullmatch): если осталось хоть
+# одно уточнение — отрицание, второе условие, месяц, «в среднем», id видео, —
+# вопрос уходит в LLM, а не получает уверенно неверное число.
+_COUNT_ABOVE_PATTERN = re.compile(
+    r"сколько\s+(?:всего\s+)?видео"
+    r"(?:\s+(?:набрал\w*|получил\w*|собрал\w*|име\w*|у\s+которых|где))?"
+    r"\s+(?P<cmp>больше|более|свыше|меньше|менее)\s+(?:чем\s+)?"
+    + _NUMBER + r"\s+" + _METRIC + r"(?:\s+за\s+вс[её]\s+время)?",
+    re.IGNORECASE,
+)
+
+_GROWTH_TAIL = r"(?:\s+(?:у\s+)?(?:все\w*\s+)?видео)?\s+" + _DATE
+
+_GROWTH_PATTERNS = (
+    re.compile(
+        r"(?:на\s*сколько\s+(?:всего\s+)?(?:выросл|увеличил|прибавил)\w*\s+(?:суммарн\w*\s+|общ\w*\s+)?"
+        r"|(?:какой|каков)\s+(?:был\s+)?(?:суммарн\w*\s+|общ\w*\s+)?прирост\s+)" + _METRIC + _GROWTH_TAIL,
+        re.IGNORECASE,
+    ),
+    re.compile(
+        r"на\s*сколько\s+" + _METRIC + r"\s+(?:в\s+сумме\s+|суммарно\s+|всего\s+)?"
+        r"(?:выросл|увеличил|прибавил|набрал)\w*" + _GROWTH_TAIL,
+        re.IGNORECASE,
+    ),
+)
+
+_TOP_PATTERN = re.compile(
+    r"(?:(?:покажи|выведи|дай|назови)\s+)?топ[\s\-]*(?P<limit>\d+)?\s+видео\s+по\s+(?:количеству\s+|числу\s+)?"
+    + _METRIC,
+    re.IGNORECASE,
+)
+
+_PUBLISHED = r"(?:было\s+)?(?:опубликов|выпуст|выложи|загрузи|вышл|вышел)\w*"
+
+_CREATOR_VIDEOS_PATTERN = re.compile(
+    r"сколько\s+(?:всего\s+)?видео\s+(?:" + _PUBLISHED + r"\s+)?(?:у\s+)?(?:креатор|автор|создател)\w*"
+    r"\s+(?:с\s+)?(?:id\s+)?(?P<creator>[0-9a-fA-F][0-9a-fA-F\-]{7,})"
+    r"(?:\s+" + _PUBLISHED + r")?(?:\s+" + _DATE + r")?",
+    re.IGNORECASE,
+)
+
 
 class DateRange(BaseModel):
     start_date: date
     end_date: date
 
 
+class Intent(BaseModel):
+    name: Literal["count_videos_above", "growth", "top_videos", "creator_videos"]
+    metric: Optional[str] = None
+    op: Optional[str] = None
+    threshold: Optional[int] = None
+    limit: Optional[int] = None
+    creator_id: Optional[str] = None
+    date_range: Optional[DateRange] = None
+
+
 class DBQuestion(BaseModel):
     question: str = Field(..., min_length=3, max_length=500)
     normalized_question: str | None = None
@@ -57,6 +143,22 @@ class DBQuestion(BaseModel):
 
 
 def parse_date_range(question: str) -> Optional[DateRange]:
+    cross_match = _CROSS_MONTH_RANGE_PATTERN.search(question)
+    if cross_match:
+        end_year = int(cross_match.group("year"))
+        return DateRange(
+            start_date=date(
+                int(cross_match.group("start_year") or end_year),
+                _MONTHS[cross_match.group("start_month").lower()],
+                int(cross_match.group("start_day")),
+            ),
+            end_date=date(
+                end_year,
+                _MONTHS[cross_match.group("end_month").lower()],
+                int(cross_match.group("end_day")),
+            ),
+        )
+
     range_match = _RANGE_DATE_PATTERN.search(question)
     if range_match:
         month = _MONTHS[range_match.group("month").lower()]
@@ -76,4 +178,47 @@ def parse_date_range(question: str) -> Optional[DateRange]:
         single_date = date(year, month, day)
         return DateRange(start_date=single_date, end_date=single_date)
 
-    return None
\ No newline at end of file
+    return None
+
+
+def parse_number(number: str, unit: str | None = None) -> int:
+    value = float(number.replace(" ", "").replace("\u00a0", "").replace(",", "."))
+    unit = (unit or "").lower()
+    if unit.startswith("тыс"):
+        value *= 1_000
+    elif unit.startswith(("млн", "миллион")):
+        value *= 1_000_000
+    return int(value)
+
+
+def parse_intent(question: str, date_range: Optional[DateRange] = None) -> Optional[Intent]:
+    """Распознаёт типовые вопросы, на которые есть готовый SQL.
+
+    Вопрос должен совпасть с шаблоном целиком, иначе — None и ответ через LLM.
+    """
+    question = " ".join(question.split()).rstrip("?!. ")
+
+    match = _CREATOR_VIDEOS_PATTERN.fullmatch(question)
+    if match:
+        return Intent(name="creator_videos", creator_id=match.group("creator"), date_range=date_range)
+
+    match = _COUNT_ABOVE_PATTERN.fullmatch(question)
+    if match and date_range is None:
+        return Intent(
+            name="count_videos_above",
+            metric=_METRICS[match.group("metric").lower()],
+            op=_COMPARISONS[match.group("cmp").lower()],
+            threshold=parse_number(match.group("number"), match.group("unit")),
+        )
+
+    match = next(filter(None, (p.fullmatch(question) for p in _GROWTH_PATTERNS)), None)
+    if match and date_range is not None:
+        return Intent(name="growth", metric=_METRICS[match.group("metric").lower()], date_range=date_range)
+
+    match = _TOP_PATTERN.fullmatch(question)
+    if match and date_range is None:
+        # длинный топ уходит файлом через ResultSink, а не обрезается молча
+        limit = int(match.group("limit") or 10)
+        return Intent(name="top_videos", metric=_METRICS[match.group("metric").lower()], limit=limit)
+
+    return None
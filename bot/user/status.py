@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+from loguru import logger
+
+STATUS_TEXT = {
+    'sql': "✍️ Составляю SQL-запрос...",
+    'db': "🗄 Выполняю запрос к базе данных...",
+    'format': "📝 Оформляю ответ...",
+}
+
+
+class StatusMessage:
+    """Сообщение о ходе ответа, которое правится не чаще раза в interval секунд.
+
+    update() не ждёт Telegram: правка уходит из фоновой задачи, и если этапы
+    сменились быстрее интервала, показывается только последний. finish()
+    отменяет несделанную правку и сразу ставит итоговый текст.
+    """
+
+    def __init__(self, message: Message, interval: float) -> None:
+        self.message = message
+        self.interval = interval
+        self.text = message.text
+        self._edited_at = time.monotonic()
+        self._pending: str | None = None
+        self._task: asyncio.Task | None = None
+
+    async def update(self, status: str) -> None:
+        text = STATUS_TEXT.get(status, status)
+        if text == self.text:
+            return
+        self._pending = text
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush())
+
+    async def _flush(self) -> None:
+        try:
+            while self._pending is not None:
+                await asyncio.sleep(max(0.0, self._edited_at + self.interval - time.monotonic()))
+                text, self._pending = self._pending, None
+                await self._edit(text)
+        finally:
+            self._task = None
+
+    async def _edit(self, text: str, **kwargs) -> None:
+        try:
+            await self.message.edit_text(text, **kwargs)
+        except TelegramRetryAfter as e:
+            logger.warning('Telegram просит подождать {} c перед правкой статуса', e.retry_after)
+            self._edited_at = time.monotonic() + e.retry_after
+            return
+        except TelegramBadRequest as e:
+            logger.debug('Статус не обновлён: {}', e)
+        self.text = text
+        self._edited_at = time.monotonic()
+
+    async def finish(self, text: str, **kwargs) -> None:
+        self._pending = None
+        if self._task is not None:
+            self._task.cancel()
+        try:
+            await self.message.edit_text(text, **kwargs)
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            await self.message.edit_text(text, **kwargs)
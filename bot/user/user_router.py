@@ -1,11 +1,14 @@
 from aiogram import Router, F
 from aiogram.filters import CommandStart
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.utils.markdown import html_decoration as hd
 from user.kbs import main_kbs
-from gpt import ask_with_db
+from gpt import ask_coalesced
 from user.kbs import main_kbs
 from user.schemas import DBQuestion
+from user.status import StatusMessage
+from config import settings
+from pipeline.metrics import stage, trace
 
 user_router = Router()
 
@@ -28,33 +31,40 @@ async def chat_realisation(call: CallbackQuery) -> None:
     await call.answer()
 
 
-@user_router.message(F.text.startswith('/db'))
+@user_router.message(F.text.startswith('/db'), flags={'throttle': True})
 async def db_question(message: Message) -> None:
     user_query = message.text.removeprefix('/db').strip()
     if not user_query:
         await message.answer("⚠️ Добавьте вопрос после команды /db.")
         return
 
-    status_message = await message.answer("🧠 Думаю и обращаюсь к базе данных...")
+    async with trace(user_id=message.from_user.id) as current:
+        with stage('telegram'):
+            status_message = await message.answer("🧠 Думаю и обращаюсь к базе данных...")
+        status = StatusMessage(status_message, settings.STATUS_EDIT_INTERVAL)
 
-    try:
-        parsed = DBQuestion(question=user_query)
-        extra_context = None
-        if parsed.date_range:
-            extra_context = (
-                f"Диапазон дат: {parsed.date_range.start_date} - "
-                f"{parsed.date_range.end_date} (включительно)."
+        try:
+            parsed = DBQuestion(question=user_query)
+            answer = await ask_coalesced(
+                parsed.normalized_question,
+                user_id=message.from_user.id,
+                date_range=parsed.date_range,
+                on_status=status.update,
             )
-
-    
-        answer = await ask_with_db(parsed.normalized_question, extra_context=extra_context)
-        response = (
-            f"{hd.bold('✅ Ответ от Data-GPT')}\n\n"
-            f"{hd.italic('Запрос:')} {hd.code(parsed.normalized_question)}\n\n"
-            f"{answer}"
-        )
-        await status_message.edit_text(response)
-    except Exception as exc:
-        await status_message.edit_text(
-            f"{hd.bold('🚨 Ошибка при запросе')}\n{hd.code(str(exc))}"
-        )
\ No newline at end of file
+            response = (
+                f"{hd.bold('✅ Ответ от Data-GPT')}\n\n"
+                f"{hd.italic('Запрос:')} {hd.code(parsed.normalized_question)}\n\n"
+                f"{hd.quote(answer.text)}"
+            )
+            with stage('telegram'):
+                await status.finish(response)
+                if answer.document:
+                    await message.answer_document(
+                        FSInputFile(answer.document),
+                        caption=f"Результат целиком: {answer.total_rows} строк",
+                    )
+        except Exception as exc:
+            current.outcome = 'error'
+            await status.finish(
+                f"{hd.bold('🚨 Ошибка при запросе')}\n{hd.code(str(exc))}"
+            )
\ No newline at end of file